@@ -4,17 +4,47 @@
 # Lizenz: Apache v 2.0
 
 
-import requests
+import threading
 
+from session import getSession
+
+#credentials of an org, see Auth
+CREDENTIALS = ('base', 'client_id', 'client_secret', 'username', 'password', 'security_token')
+#default login url and user
+BASE = "https://login.salesforce.com/services/oauth2/token"
+USERNAME = 'email@example.com'
+
+"""
+returns the key of the token of a user in the TokenCache
+"""
+def tokenKey(username = USERNAME, base = BASE):
+    return username + '@' + base
+
+"""
+    session:     Session, default the shared session
+    cache:       TokenCache, if set tokens are reused across invocations
+    credentials: dict, overrides the default credentials (keys see CREDENTIALS,
+                 base is the token url of the login, e.g. https://test.salesforce.com/services/oauth2/token)
+"""
 class Auth():
-    def __init__(self):
-        self.timeout = 25.000
-        self.base = "https://login.salesforce.com/services/oauth2/token"
+    def __init__(self, session = None, cache = None, credentials = None):
+        self.session = session if session != None else getSession()
+        self.timeout = self.session.timeout
+        #TokenCache, if set tokens are reused across invocations
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.instance_url = None
+        self.base = BASE
         self.client_id = 'Oauth client id from your Salesforce App' 
         self.client_secret = 'Oauth client id from your Salesforce App'
-        self.username = 'email@example.com'
+        self.username = USERNAME
         self.password = 'top secret'
         self.security_token = 'Security token for that user'
+        for key, value in (credentials or {}).items():
+            if key not in CREDENTIALS:
+                raise ValueError("unknown credential '" + key + "', use " + ", ".join(CREDENTIALS))
+            setattr(self, key, value)
 
     """
     Oauth authentification with salesforce, as result access_tokon and instance_url is set 
@@ -24,23 +54,116 @@ class Auth():
       - username
       - password 
       - security Token
+    if a cache is set, a valid cached token is used without login
     params
     ------
+    force: bool, if True login even if a cached token exists
+
     return
     ------
           access_token, instance_url
     """
-    def auth(self):
+    def auth(self, force = False):
+        key = tokenKey(self.username, self.base)
+        if not force:
+            self.access_token, self.instance_url = self.cached()
+            if self.access_token != None:
+                return self.access_token, self.instance_url
+
         p = { 'grant_type'    : 'password', 
               'client_id'     : self.client_id, 
               'client_secret' : self.client_secret, 
               'username'      : self.username, 
               'password'      : self.password + self.security_token }
 
-        r = requests.post(self.base, params=p, timeout=self.timeout)
+        #form body, the url (logged by urllib3) does not carry the credentials
+        r = self.session.post(self.base, data=p, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
 
         self.access_token = r.json()['access_token']
         self.instance_url = r.json()['instance_url']
+        if self.cache != None:
+            self.cache.put(key, self.access_token, self.instance_url)
 
         return self.access_token, self.instance_url
 
+    """
+    returns the cached token without login
+
+    return
+    ------
+          access_token, instance_url or None, None if no valid token is cached
+    """
+    def cached(self):
+        if self.cache == None:
+            return None, None
+        return self.cache.get(tokenKey(self.username, self.base))
+
+    """
+    login again, e.g. if a request was rejected with 401 (session expired)
+    if concurrent requests fail, only the first one does the login
+
+    params
+    ------
+    stale: String, the rejected access token
+
+    return
+    ------
+          access_token, instance_url
+    """
+    def refresh(self, stale):
+        with self.lock:
+            if self.access_token != None and self.access_token != stale:
+                #already refreshed
+                return self.access_token, self.instance_url
+            return self.auth(force = True)
+
+
+"""
+base for classes calling the API with the token of an Auth, a request
+rejected with 401 (session expired) is sent again with a new token
+
+    access_token: String
+    instance_url: String
+    session:      Session, default the shared session
+    auth:         Auth, if set a rejected token (401) is renewed
+"""
+class Authorized():
+    def __init__(self, access_token, instance_url, session = None, auth = None):
+        self.session = session if session != None else getSession()
+        self.auth = auth
+        self.timeout = self.session.timeout
+        self.access_token = access_token
+        self.instance_url = instance_url
+
+    """
+    sends a request
+
+    params
+    ------
+    method:  String, GET, POST, ...
+    url:     String, full url
+    headers: dict, the token is replaced on a retry
+    kwargs:  passed to the session
+
+    return
+    ------
+    response
+    """
+    def send(self, method, url, headers, **kwargs):
+        data = kwargs.get('data')
+        start = data.tell() if hasattr(data, 'seek') else None
+        r = self.session.request(method, url, headers = headers, **kwargs)
+        if r.status_code != 401 or self.auth == None:
+            return r
+
+        r.close()
+        self.access_token, self.instance_url = self.auth.refresh(self.access_token)
+        if 'Authorization' in headers:
+            headers['Authorization'] = 'Bearer ' + self.access_token
+        if 'X-SFDC-Session' in headers:
+            headers['X-SFDC-Session'] = self.access_token
+        if start != None:
+            data.seek(start)
+        return self.session.request(method, url, headers = headers, **kwargs)
@@ -0,0 +1,204 @@
+# File name: bench.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+"""
+benchmark of the operations of salesforce.py against the local mockserver
+(no org, no API limits), each operation runs in its own process, so the
+peak RSS is measured per operation
+
+usage: python3 bench.py [options] [operation ...]
+    --records <n>:     Accounts in the mock org (default 10000)
+    --page-size <n>:   records per query page (default 2000)
+    --latency <sec>:   delay of each request in the mock (default 0)
+    --concurrency <n>: concurrent requests of exists, delete, dedup (default 1)
+    operations:        list, exists, delete, bulk-delete, bulk-insert, dedup, dedup-groups,
+                       auth (default all)
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import logging
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    #no peak RSS (e.g. Windows)
+    resource = None
+
+from mockserver import MockSalesforce
+from instrument import Recorder, percentile
+
+
+#deduplicate sends 2 requests per group (1001 requests for 500 groups), so only the first ids are grouped
+DEDUP_RECORDS = 1000
+#number of logins of the auth benchmark
+LOGINS = 100
+
+
+def benchList(sf, url, ids):
+    return sf.writeCsv(sf.iterObjects('Account', 'Id,Name,BillingCity'), os.devnull) - 1
+
+def benchExists(sf, url, ids):
+    if len(sf.missing('Account', ids)) > 0:
+        raise ValueError("ids are missing")
+    return len(ids)
+
+def benchDelete(sf, url, ids):
+    #sObject Collections only
+    sf.bulk_threshold = len(ids) + 1
+    return sf.delete('Account', ids)
+
+def benchBulkDelete(sf, url, ids):
+    sf.bulk_threshold = 1
+    return sf.delete('Account', ids)
+
+def benchBulkInsert(sf, url, ids):
+    results = sf.insertBulk('Account', [{ 'Name' : 'Bench ' + str(i) } for i in range(len(ids))])
+    return len([r for r in results if r['success']])
+
+def benchDedup(sf, url, ids):
+    ids = ids[:DEDUP_RECORDS]
+    for start in range(0, len(ids) - 1, 2):
+        sf.deduplicate(ids[start:start + 2])
+    return len(ids)
+
+def benchDedupGroups(sf, url, ids):
+    ids = ids[:DEDUP_RECORDS]
+    sf.deduplicateGroups([ids[start:start + 2] for start in range(0, len(ids) - 1, 2)])
+    return len(ids)
+
+def benchAuth(sf, url, ids):
+    from auth import Auth
+    auth = Auth()
+    auth.base = url + '/services/oauth2/token'
+    for i in range(LOGINS):
+        auth.auth(force = True)
+    return LOGINS
+
+OPERATIONS = {
+    'list'        : benchList,
+    'exists'      : benchExists,
+    'delete'      : benchDelete,
+    'bulk-delete' : benchBulkDelete,
+    'bulk-insert' : benchBulkInsert,
+    'dedup'       : benchDedup,
+    'dedup-groups': benchDedupGroups,
+    'auth'        : benchAuth,
+}
+
+"""
+runs one operation (in the child process) and prints the result as json line
+
+params
+------
+op:          String, operation
+url:         String, url of the mockserver
+ids:         [], ids of the Accounts
+concurrency: int, concurrent requests
+"""
+def run(op, url, ids, concurrency):
+    from session import configure
+    from salesforce import Salesforce
+
+    logging.basicConfig(stream = sys.stderr, level = logging.WARNING)
+    recorder = Recorder()
+    configure(recorder = recorder, pool_size = max(10, concurrency))
+    sf = Salesforce('mock-token', url)
+    sf.concurrency = concurrency
+    sf.polling.initial = 0.01
+
+    start = time.perf_counter()
+    count = OPERATIONS[op](sf, url, ids)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted([l for stats in recorder.ops.values() for l in stats['latencies']])
+    rss = None
+    if resource != None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #kilobytes on Linux, bytes on macOS
+        rss = rss / 1024.0 if sys.platform != 'darwin' else rss / 1024.0 / 1024.0
+    print(json.dumps({ 'op' : op, 'records' : count, 'seconds' : elapsed, 'requests' : len(latencies),
+            'p50' : percentile(latencies, 0.5), 'p95' : percentile(latencies, 0.95),
+            'p99' : percentile(latencies, 0.99), 'rss' : rss }))
+
+"""
+starts the mockserver and runs each operation in a child process on a new org
+
+return
+------
+list of results (dicts)
+"""
+def bench(operations, records, page_size, latency, concurrency):
+    mock = MockSalesforce(latency = latency, page_size = page_size)
+    url = mock.start()
+    results = []
+    try:
+        for op in operations:
+            mock.reset()
+            ids = mock.populate(records)
+            with tempfile.NamedTemporaryFile('w', suffix = '.ids') as f:
+                f.write('\n'.join(ids))
+                f.flush()
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', op, '--url', url,
+                        '--ids', f.name, '--concurrency', str(concurrency)], stdout = subprocess.PIPE, check = True)
+            results.append(json.loads(child.stdout.decode('utf-8').splitlines()[-1]))
+    finally:
+        mock.stop()
+    return results
+
+def report(results, out = None):
+    if out == None:
+        out = sys.stdout
+    print("%-12s %8s %8s %10s %8s %8s %8s %8s %9s" % ('operation', 'records', 'time', 'records/s',
+            'requests', 'p50', 'p95', 'p99', 'peak RSS'), file=out)
+    for r in results:
+        rss = "%7.1fMB" % r['rss'] if r['rss'] != None else '-'
+        print("%-12s %8d %7.2fs %10.0f %8d %6.1fms %6.1fms %6.1fms %9s" % (r['op'], r['records'], r['seconds'],
+                r['records'] / r['seconds'] if r['seconds'] > 0 else 0, r['requests'],
+                r['p50'] * 1000, r['p95'] * 1000, r['p99'] * 1000, rss), file=out)
+
+def main(argv):
+    opts, args = getopt.getopt(argv, "", ['records=', 'page-size=', 'latency=', 'concurrency=', 'run=', 'url=', 'ids='])
+    records = 10000
+    page_size = 2000
+    latency = 0.0
+    concurrency = 1
+    child = None
+    url = None
+    ids = None
+    for opt, arg in opts:
+        if opt in (['--records']):
+            records = int(arg)
+        if opt in (['--page-size']):
+            page_size = int(arg)
+        if opt in (['--latency']):
+            latency = float(arg)
+        if opt in (['--concurrency']):
+            concurrency = int(arg)
+        if opt in (['--run']):
+            child = arg
+        if opt in (['--url']):
+            url = arg
+        if opt in (['--ids']):
+            with open(arg, 'r') as f:
+                ids = f.read().split('\n')
+
+    if child != None:
+        run(child, url, ids, concurrency)
+        return
+
+    operations = args if len(args) > 0 else list(OPERATIONS)
+    for op in operations:
+        if op not in OPERATIONS:
+            raise ValueError("unknown operation '" + op + "', use " + ", ".join(OPERATIONS))
+    report(bench(operations, records, page_size, latency, concurrency))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
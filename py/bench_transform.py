@@ -0,0 +1,85 @@
+# File name: bench_transform.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+"""
+benchmark of the row transformation of listObjects (no network), compares
+the former per cell regexp with the columnar transform.Projection
+
+usage: python3 bench_transform.py [rows] [page size]
+"""
+
+import re
+import sys
+import time
+import random
+
+from transform import Projection
+
+
+FIELDS = 'Id,BillingCountry,-,Name,-,BillingStreet,-,BillingPostalCode,BillingCity,-'
+
+"""
+creates query pages with random records
+"""
+def createPages(rows, page_size):
+    random.seed(1)
+    words = ['Müller', 'GmbH & Co. KG', 'Hauptstraße 12', 'Köln', 'info@example.com', 'O\'Brien', 'a;b,c', None]
+    pages = []
+    for start in range(0, rows, page_size):
+        records = []
+        for i in range(start, min(rows, start + page_size)):
+            records.append({ 'attributes' : { 'type' : 'Account' },
+                    'Id' : '0011r00001%08dAAA' % i,
+                    'BillingCountry' : random.choice(['Germany', 'Österreich', 'Schweiz']),
+                    'Name' : str(random.choice(words)) + ' ' + str(i),
+                    'BillingStreet' : random.choice(words),
+                    'BillingPostalCode' : str(10000 + i % 90000),
+                    'BillingCity' : random.choice(words) })
+        pages.append(records)
+    return pages
+
+"""
+per cell transformation as done by listObjects before
+"""
+def regexpLines(pages, fields):
+    header = fields.split(",")
+    regexp = re.compile('[^a-zA-Z0-9@ßäüö]')
+    retval = []
+    for records in pages:
+        for r in records:
+            line = []
+            for f in header:
+                if f == "-":
+                    line.append('')
+                    continue
+                line.append(regexp.sub(' ', str(r[f])))
+            retval.append(line)
+    return retval
+
+def projectionLines(pages, fields):
+    projection = Projection(fields)
+    retval = []
+    for records in pages:
+        retval.extend(projection.apply(records))
+    return retval
+
+def measure(name, func, pages, rows):
+    start = time.perf_counter()
+    lines = func(pages, FIELDS)
+    elapsed = time.perf_counter() - start
+    print("%-12s %10.0f rows/s (%.3fs)" % (name, rows / elapsed, elapsed))
+    return lines
+
+def main(argv):
+    rows = int(argv[0]) if len(argv) > 0 else 200000
+    page_size = int(argv[1]) if len(argv) > 1 else 2000
+    pages = createPages(rows, page_size)
+    before = measure("regexp", regexpLines, pages, rows)
+    after = measure("projection", projectionLines, pages, rows)
+    if [tuple(l) for l in before] != after:
+        raise ValueError("results differ")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
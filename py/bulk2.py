@@ -0,0 +1,288 @@
+# File name: bulk2.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import logging
+import tempfile
+
+from auth import Authorized
+from polling import Backoff
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Calls to work with Bulk API 2.0 from Salesforce, data is exchanged as CSV
+and streamed from/to files, so objects of any size can be loaded or exported
+
+ingest (insert, update, upsert, delete)
+1 create a job
+2 upload the csv data
+3 close the job (UploadComplete)
+4 wait until the job is complete
+5 receive successful/failed results
+
+query
+1 create a query job
+2 wait until the job is complete
+3 download the results page by page (Sforce-Locator)
+"""
+class Bulk2(Authorized):
+    def __init__(self, access_token, instance_url, session = None, auth = None):
+        Authorized.__init__(self, access_token, instance_url, session, auth)
+        self.base = self.instance_url + '/services/data/v47.0/jobs/'
+        #max csv bytes per ingest job (limit of Salesforce is 150MB after base64 encoding)
+        self.max_bytes = 100000000
+        #max records per result page of a query job (None: chosen by Salesforce)
+        self.max_records = None
+        #size of the chunks read from a download
+        self.chunk_size = 1024 * 1024
+        self.polling = Backoff()
+        #called with the job info (dict) after each poll of a job
+        self.progress = None
+
+    def headers(self, content_type = 'application/json'):
+        return { 'Authorization' : 'Bearer ' + self.access_token, 'Content-Type' : content_type }
+
+    """
+    creates an ingest job
+
+    params
+    ------
+    operation:   String (insert, update, upsert, delete, hardDelete)
+    obj:         String Salesforce Object Type
+    external_id: String, external id field, needed for upsert
+
+    return
+    ------
+    job id
+    """
+    def createIngestJob(self, operation, obj, external_id = None):
+        p = { 'operation' : operation, 'object' : obj, 'contentType' : 'CSV', 'lineEnding' : 'LF' }
+        if external_id != None:
+            p['externalIdFieldName'] = external_id
+        r = self.send('POST', self.base + 'ingest', self.headers(), json=p, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+        logger.info("Created ingest job with id: %s", r.json()['id'])
+        return r.json()['id']
+
+    """
+    uploads the csv data of an ingest job
+
+    params
+    ------
+    jobId: String
+    data:  file object (opened binary) or bytes
+    """
+    def upload(self, jobId, data):
+        url = self.base + 'ingest/' + jobId + '/batches'
+        r = self.send('PUT', url, self.headers('text/csv'), data=data, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+
+    """
+    changes the state of a job (UploadComplete closes an ingest job, Aborted aborts a job)
+
+    params
+    ------
+    jobId: String
+    kind:  String, ingest or query
+    state: String
+    """
+    def setState(self, jobId, kind, state):
+        url = self.base + kind + '/' + jobId
+        r = self.send('PATCH', url, self.headers(), json={ 'state' : state }, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+
+    """
+    returns the job info (state, numberRecordsProcessed, numberRecordsFailed, ...)
+    """
+    def jobInfo(self, jobId, kind):
+        r = self.send('GET', self.base + kind + '/' + jobId, self.headers(), timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+        return r.json()
+
+    """
+    blocks until the job is complete, the job is polled with self.polling
+
+    return
+    ------
+    job info
+    """
+    def waitJob(self, jobId, kind):
+        def check():
+            info = self.jobInfo(jobId, kind)
+            if self.progress != None:
+                self.progress(info)
+            if info['state'] == 'JobComplete':
+                return info
+            if info['state'] == 'Failed' or info['state'] == 'Aborted':
+                raise ValueError("Error in job with id '" + jobId + "': " + info['state'] + " " + str(info.get('errorMessage', '')))
+            return None
+
+        return self.polling.poll(check)
+
+    """
+    loads csv data with an ingest job, data exceeding self.max_bytes is split
+    into several jobs. Each job is spooled to a temporary file before upload,
+    so the memory usage does not depend on the size of the data
+
+    params
+    ------
+    operation:   String (insert, update, upsert, delete, hardDelete)
+    obj:         String Salesforce Object Type
+    source:      String filename, or iterable of csv lines (bytes or String), first line is header
+    external_id: String, external id field, needed for upsert
+
+    return
+    ------
+    list of job infos
+    """
+    def ingest(self, operation, obj, source, external_id = None):
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return self.ingest(operation, obj, f, external_id)
+
+        records = self.records(source)
+        header = next(records, None)
+        if header == None:
+            return []
+        jobs = []
+        record = next(records, None)
+        while record != None:
+            with tempfile.TemporaryFile() as spool:
+                spool.write(header)
+                size = len(header)
+                while record != None and (size == len(header) or size + len(record) <= self.max_bytes):
+                    spool.write(record)
+                    size = size + len(record)
+                    record = next(records, None)
+                spool.seek(0)
+                jobId = self.createIngestJob(operation, obj, external_id)
+                self.upload(jobId, spool)
+            self.setState(jobId, 'ingest', 'UploadComplete')
+            jobs.append(jobId)
+
+        return [self.waitJob(jobId, 'ingest') for jobId in jobs]
+
+    """
+    helper, joins csv lines to records (a quoted value may contain line breaks)
+
+    params
+    ------
+    lines: iterable of lines (bytes or String)
+
+    return
+    ------
+    generator, each record as bytes, terminated by a line break
+    """
+    def records(self, lines):
+        record = b''
+        for line in lines:
+            if isinstance(line, str):
+                line = line.encode('utf-8')
+            record = record + line
+            if record.count(b'"') % 2 == 1:
+                continue
+            if not record.endswith(b'\n'):
+                record = record + b'\n'
+            yield record
+            record = b''
+        if len(record) > 0:
+            yield record + b'\n'
+
+    """
+    writes the successful or failed results of an ingest job to a file
+
+    params
+    ------
+    jobId:    String
+    kind:     String, successfulResults, failedResults or unprocessedrecords
+    filename: String
+
+    return
+    ------
+    number of bytes written
+    """
+    def saveResults(self, jobId, kind, filename):
+        url = self.base + 'ingest/' + jobId + '/' + kind + '/'
+        with self.send('GET', url, self.headers(), stream=True, timeout=self.timeout) as r:
+            if r.status_code >= 400:
+                raise ValueError(r.text)
+            with open(filename, 'wb') as out:
+                return self.copy(r, out, False)
+
+    """
+    exports the result of a SOQL query to a csv file, the result pages are
+    streamed to disk, the header is written once
+
+    params
+    ------
+    soql:     String, e.g. SELECT Id,Name FROM Account
+    filename: String
+
+    return
+    ------
+    number of exported records
+    """
+    def query(self, soql, filename):
+        p = { 'operation' : 'query', 'query' : soql, 'contentType' : 'CSV', 'lineEnding' : 'LF' }
+        r = self.send('POST', self.base + 'query', self.headers(), json=p, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+        jobId = r.json()['id']
+        logger.info("Created query job with id: %s", jobId)
+        self.waitJob(jobId, 'query')
+
+        records = 0
+        locator = None
+        with open(filename, 'wb') as out:
+            while True:
+                params = {}
+                if locator != None:
+                    params['locator'] = locator
+                if self.max_records != None:
+                    params['maxRecords'] = self.max_records
+                url = self.base + 'query/' + jobId + '/results'
+                with self.send('GET', url, self.headers(), params=params, stream=True, timeout=self.timeout) as r:
+                    if r.status_code >= 400:
+                        raise ValueError(r.text)
+                    #each page starts with the header
+                    self.copy(r, out, locator != None)
+                    records = records + int(r.headers.get('Sforce-NumberOfRecords', 0))
+                    locator = r.headers.get('Sforce-Locator')
+                if locator == None or locator == 'null':
+                    break
+
+        return records
+
+    """
+    helper, copies a streamed response to a file
+
+    params
+    ------
+    r:          streamed response
+    out:        file object (binary)
+    skipHeader: bool, if True the first line is not written
+
+    return
+    ------
+    number of bytes written
+    """
+    def copy(self, r, out, skipHeader):
+        written = 0
+        for chunk in r.iter_content(self.chunk_size):
+            if skipHeader:
+                pos = chunk.find(b'\n')
+                if pos < 0:
+                    continue
+                chunk = chunk[pos + 1:]
+                skipHeader = False
+            out.write(chunk)
+            written = written + len(chunk)
+        return written
@@ -0,0 +1,136 @@
+# File name: cache.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+"""
+local cache of query results and records, backed by sqlite
+in memory (valid for one run) or in a file (shared by following runs)
+entries expire after ttl seconds, writes and deletes through Salesforce/Bulk
+invalidate the entries of the changed sobject
+
+    path: String, sqlite file, ':memory:' for a cache of this run only
+    ttl:  int, seconds an entry is valid
+"""
+class Cache():
+    def __init__(self, path = ':memory:', ttl = 3600):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), 0o700, exist_ok = True)
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, sobject TEXT, value TEXT, expires REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS queries_sobject ON queries (sobject)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS records (sobject TEXT, id TEXT, value TEXT, expires REAL, PRIMARY KEY (sobject, id))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS records_expires ON records (expires)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS records_id15 ON records (sobject, substr(id, 1, 15))')
+        self.purge()
+
+    """
+    returns a cached query result
+
+    params
+    ------
+    key: String, e.g. the query url
+
+    return
+    ------
+    json value, None if not cached or expired
+    """
+    def getQuery(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM queries WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return None if row == None else json.loads(row[0])
+
+    """
+    stores a query result
+
+    params
+    ------
+    key:     String, e.g. the query url
+    sobject: String, queried sobject (for invalidation)
+    value:   json value
+    """
+    def putQuery(self, key, sobject, value):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO queries (key, sobject, value, expires) VALUES (?, ?, ?, ?)',
+                    (key, sobject, json.dumps(value), time.time() + self.ttl))
+            self.db.commit()
+
+    """
+    returns the cached records of the ids
+
+    params
+    ------
+    sobject: String
+    ids:     [], list of ids
+
+    return
+    ------
+    dict id -> record (json value)
+    """
+    def getRecords(self, sobject, ids):
+        retval = {}
+        now = time.time()
+        with self.lock:
+            #max 999 parameters per statement
+            for start in range(0, len(ids), 900):
+                chunk = ids[start:start + 900]
+                sql = 'SELECT id, value FROM records WHERE sobject = ? AND expires > ? AND id IN (' + ','.join(['?'] * len(chunk)) + ')'
+                for i, value in self.db.execute(sql, [sobject, now] + chunk):
+                    retval[i] = json.loads(value)
+        return retval
+
+    """
+    stores records
+
+    params
+    ------
+    sobject: String
+    records: dict id -> record (json value)
+    """
+    def putRecords(self, sobject, records):
+        expires = time.time() + self.ttl
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO records (sobject, id, value, expires) VALUES (?, ?, ?, ?)',
+                    [(sobject, i, json.dumps(r), expires) for i, r in records.items()])
+            self.db.commit()
+
+    """
+    removes the cached query results of an sobject and the given (or all) records
+
+    params
+    ------
+    sobject: String
+    ids:     [], list of ids, None for all records of the sobject
+    """
+    def invalidate(self, sobject, ids = None):
+        with self.lock:
+            self.db.execute('DELETE FROM queries WHERE sobject = ?', (sobject,))
+            if ids == None:
+                self.db.execute('DELETE FROM records WHERE sobject = ?', (sobject,))
+            else:
+                #15 and 18 character ids
+                self.db.executemany('DELETE FROM records WHERE sobject = ? AND substr(id, 1, 15) = ?',
+                        [(sobject, i[:15]) for i in ids])
+            self.db.commit()
+
+    """
+    removes expired entries
+    """
+    def purge(self):
+        now = time.time()
+        with self.lock:
+            self.db.execute('DELETE FROM queries WHERE expires <= ?', (now,))
+            self.db.execute('DELETE FROM records WHERE expires <= ?', (now,))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
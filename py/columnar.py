@@ -0,0 +1,138 @@
+# File name: columnar.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import json
+import datetime
+
+from transform import getter
+
+
+"""
+converters from the json value of a query to a python value, per field type
+of the describe metadata (not listed types are kept as String)
+"""
+def toBool(v):
+    return bool(v)
+
+def toInt(v):
+    return int(v)
+
+def toFloat(v):
+    return float(v)
+
+def toDate(v):
+    return datetime.date.fromisoformat(v)
+
+def toDatetime(v):
+    #e.g. 2018-05-03T12:01:02.000+0000
+    return datetime.datetime.strptime(v, '%Y-%m-%dT%H:%M:%S.%f%z')
+
+def toString(v):
+    if isinstance(v, str):
+        return v
+    if isinstance(v, dict):
+        #compound fields (address, location)
+        return json.dumps(v)
+    return str(v)
+
+CONVERTERS = {
+    'boolean'  : toBool,
+    'int'      : toInt,
+    'double'   : toFloat,
+    'currency' : toFloat,
+    'percent'  : toFloat,
+    'date'     : toDate,
+    'datetime' : toDatetime,
+}
+
+
+"""
+returns the arrow type of a field type of the describe metadata
+"""
+def arrowType(pa, field_type):
+    if field_type == 'boolean':
+        return pa.bool_()
+    if field_type == 'int':
+        return pa.int64()
+    if field_type in ('double', 'currency', 'percent'):
+        return pa.float64()
+    if field_type == 'date':
+        return pa.date32()
+    if field_type == 'datetime':
+        return pa.timestamp('ms', tz='UTC')
+    return pa.string()
+
+
+"""
+writes query records to a Parquet or Arrow IPC file, the records are collected
+to row groups of row_group_size rows, so only one row group is kept in memory
+needs the package pyarrow
+
+    path:           String, output file
+    fields:         [], list of field names (or relationship paths)
+    types:          [], list of field types of the describe metadata (e.g. 'int', 'datetime')
+    format:         String, 'parquet' or 'arrow'
+    row_group_size: int, rows per row group (parquet) or record batch (arrow)
+"""
+class ColumnarSink():
+    def __init__(self, path, fields, types, format = 'parquet', row_group_size = 100000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            import pyarrow.ipc
+        except ImportError:
+            raise ValueError("format " + format + " needs the package pyarrow")
+        self.pa = pyarrow
+        self.fields = fields
+        self.getters = [getter(f) for f in fields]
+        self.converters = [CONVERTERS.get(t, toString) for t in types]
+        self.schema = pyarrow.schema([(f, arrowType(pyarrow, t)) for f, t in zip(fields, types)])
+        self.row_group_size = row_group_size
+        self.columns = [[] for f in fields]
+        self.rows = 0
+        self.count = 0
+        if format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        elif format == 'arrow':
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+        else:
+            raise ValueError("unknown format '" + format + "', use parquet or arrow")
+
+    """
+    adds the records of one page
+
+    params
+    ------
+    records: [], list of records (json dicts) as returned by a query
+    """
+    def write(self, records):
+        for column, get, convert in zip(self.columns, self.getters, self.converters):
+            values = [get(r) for r in records]
+            column.extend([None if v == None else convert(v) for v in values])
+        self.rows = self.rows + len(records)
+        self.count = self.count + len(records)
+        if self.rows >= self.row_group_size:
+            self.flush()
+
+    """
+    writes the collected rows as one row group
+    """
+    def flush(self):
+        if self.rows == 0:
+            return
+        arrays = [self.pa.array(c, type=t) for c, t in zip(self.columns, self.schema.types)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for f in self.fields]
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,143 @@
+# File name: delta.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import os
+import json
+import sqlite3
+
+from transform import Projection
+
+
+"""
+incremental export of an sobject into a local snapshot (one sqlite file per sobject)
+the first run loads all records, each following run queries only records changed
+since the high-water mark (max SystemModstamp of the last run) and removes
+records deleted since then (queryAll with IsDeleted = true)
+
+deleted records are only found as long as they are in the recycle bin
+(15 days), run with full = True if the last run is older
+
+    sf:        Salesforce
+    directory: String, directory of the snapshots
+    watermark: String, timestamp field of the high-water mark (SystemModstamp, LastModifiedDate)
+"""
+class DeltaSync():
+    def __init__(self, sf, directory, watermark = 'SystemModstamp'):
+        self.sf = sf
+        self.directory = directory
+        self.watermark = watermark
+        os.makedirs(directory, exist_ok = True)
+
+    """
+    opens the snapshot of an sobject
+    """
+    def open(self, sf_type):
+        db = sqlite3.connect(os.path.join(self.directory, sf_type + '.sqlite'))
+        db.execute('CREATE TABLE IF NOT EXISTS records (Id TEXT PRIMARY KEY, record TEXT)')
+        db.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)')
+        return db
+
+    def getState(self, db, key):
+        row = db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return None if row == None else row[0]
+
+    def setState(self, db, key, value):
+        db.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    """
+    brings the snapshot of sf_type up to date
+
+    params
+    ------
+    sf_type: String, Salesforce sobject
+    fields:  String, comma separated field names, if field name is "-" its an empty field
+    full:    bool, if True all records are loaded again
+
+    return
+    ------
+    number of changed records, number of deleted records
+    """
+    def sync(self, sf_type, fields, full = False):
+        getfields = ['Id', self.watermark]
+        for f in Projection(fields).fields:
+            if f.lower() not in [g.lower() for g in getfields]:
+                getfields.append(f)
+        select = ",".join(getfields)
+
+        db = self.open(sf_type)
+        try:
+            mark = self.getState(db, 'watermark')
+            if full or mark == None or self.getState(db, 'fields') != select:
+                #first run or changed fields
+                db.execute('DELETE FROM records')
+                mark = None
+            where = '' if mark == None else '+WHERE+' + self.watermark + '+>=+' + mark
+
+            changed = 0
+            last = mark
+            for page in self.sf.queryPages('/services/data/v42.0/query?q=SELECT+' + select + '+FROM+' + sf_type + where):
+                rows = []
+                for r in page['records']:
+                    r.pop('attributes', None)
+                    rows.append((r['Id'], json.dumps(r)))
+                    last = self.maxMark(last, r[self.watermark])
+                db.executemany('INSERT OR REPLACE INTO records (Id, record) VALUES (?, ?)', rows)
+                changed = changed + len(rows)
+
+            deleted = 0
+            if mark != None:
+                purl = '/services/data/v42.0/queryAll?q=SELECT+Id,' + self.watermark + '+FROM+' + sf_type + '+WHERE+IsDeleted+=+true+AND+' + self.watermark + '+>=+' + mark
+                for page in self.sf.queryPages(purl):
+                    ids = [(r['Id'],) for r in page['records']]
+                    deleted = deleted + db.executemany('DELETE FROM records WHERE Id = ?', ids).rowcount
+
+            if last != None:
+                self.setState(db, 'watermark', last)
+            self.setState(db, 'fields', select)
+            db.commit()
+        finally:
+            db.close()
+
+        return changed, deleted
+
+    """
+    helper, returns the later of the high-water mark and a timestamp of a record
+    as SOQL literal (2018-05-03T12:01:02Z), records with the same second are
+    queried again on the next run (>=), which is harmless
+    """
+    def maxMark(self, mark, value):
+        if value == None:
+            return mark
+        value = value[:19] + 'Z'
+        if mark == None or value > mark:
+            return value
+        return mark
+
+    """
+    returns the records of the snapshot as lines
+
+    params
+    ------
+    sf_type:  String, Salesforce sobject
+    fields:   String, comma separated field names, if field name is "-" its an empty field
+    sanitize: bool, replace all non alphanumeric characters by ' '
+
+    return
+    ------
+    generator, first line is header, each following line is a tuple of field values
+    """
+    def lines(self, sf_type, fields, sanitize = True):
+        projection = Projection(fields, sanitize)
+        yield projection.header
+        db = self.open(sf_type)
+        try:
+            cursor = db.execute('SELECT record FROM records ORDER BY Id')
+            while True:
+                rows = cursor.fetchmany(2000)
+                if len(rows) == 0:
+                    break
+                yield from projection.apply([json.loads(row[0]) for row in rows])
+        finally:
+            db.close()
@@ -0,0 +1,217 @@
+# File name: dryrun.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+"""
+plans the requests of a command of salesforce.py without sending them (--dry-run)
+
+the plan is computed from the arguments, local files and the settings of the
+Salesforce client (chunk sizes, thresholds), nothing is sent: fields are only
+validated if the describe metadata is cached, counts that depend on the org
+(query pages, records of clean) are printed as notes
+"""
+
+import os
+import sys
+import math
+
+from partition import idConditions
+
+REST = '/services/data/v42.0/'
+ASYNC = '/services/async/42.0/'
+JOBS = '/services/data/v47.0/jobs/'
+
+RULE = REST + "query?q=SELECT id,MasterLabel,DeveloperName from DuplicateRule WHERE DeveloperName = 'Test_Regel'"
+#fields of salesforce.py -a
+ACCOUNT_FIELDS = 'Id,BillingCountry,-,Name,-,BillingStreet,-,BillingPostalCode,BillingCity,-'
+
+
+"""
+planned requests of a command
+
+    steps: [], (count, method, path, note), count None if it depends on the org
+"""
+class Plan():
+    def __init__(self):
+        self.steps = []
+
+    def add(self, method, path, count = 1, note = None):
+        self.steps.append((count, method, path, note))
+
+    def note(self, text):
+        self.steps.append((0, None, None, text))
+
+    """
+    adds a query and its following pages (nextRecordsUrl)
+
+    params
+    ------
+    soql:      String
+    page_size: int, max records per page (Sforce-Query-Options batchSize), None for the default
+    resource:  String, query or queryAll
+    """
+    def query(self, soql, page_size = None, resource = 'query'):
+        self.add('GET', REST + resource + '?q=' + soql)
+        self.add('GET', REST + 'query/<nextRecordsUrl>', None,
+                'one per further page of ' + str(page_size or 2000) + ' records')
+
+    """
+    adds a Bulk API (v1) job
+
+    params
+    ------
+    operation: String, insert, delete
+    sf_type:   String, Salesforce sobject
+    records:   int, number of records
+    sf:        Salesforce, batch size
+    """
+    def bulkJob(self, operation, sf_type, records, sf):
+        self.add('POST', ASYNC + 'job', 1, operation + ' ' + sf_type)
+        self.add('POST', ASYNC + 'job/<job>/batch', int(math.ceil(records / float(sf.bulk_batch_size))),
+                str(records) + ' records, max ' + str(sf.bulk_batch_size) + ' per batch')
+        self.add('POST', ASYNC + 'job/<job>', 1, 'close')
+        self.add('GET', ASYNC + 'job/<job>', None, 'polls until the batches are completed')
+        self.add('GET', ASYNC + 'job/<job>/batch/<batch>/result', int(math.ceil(records / float(sf.bulk_batch_size))))
+
+    """
+    prints the plan, one line per request
+
+    params
+    ------
+    out: stream, default stdout
+    """
+    def write(self, out = None):
+        if out == None:
+            out = sys.stdout
+        for count, method, path, note in self.steps:
+            if method == None:
+                print("# " + note, file=out)
+                continue
+            line = "%6s %-6s %s" % ('*' if count == None else str(count) + 'x', method, path)
+            if note != None:
+                line = line + "  # " + note
+            print(line, file=out)
+        known = sum([s[0] for s in self.steps if s[0] != None and s[1] != None])
+        print("# %d requests%s" % (known, ' + requests marked *' if None in [s[0] for s in self.steps] else ''), file=out)
+
+
+"""
+returns the query fields and page size of a field list, compiled if the
+describe metadata is cached, else as given
+"""
+def compileFields(sf, plan, sf_type, fields):
+    try:
+        compiled = sf.metadata.compile(sf_type, fields)
+        return compiled.query, compiled.page_size
+    except LookupError as e:
+        plan.note("fields are not validated, " + str(e))
+        query = []
+        for f in fields.split(','):
+            if f.strip() != '-' and f.strip() not in query:
+                query.append(f.strip())
+        return query, None
+
+"""
+plans a command
+
+params
+------
+sf:      Salesforce, settings of the client (not logged in)
+command: String, see salesforce.COMMANDS
+arg:     argument of the command (ids, groups or file)
+params:  dict, options of the command line (see salesforce.parseArgs)
+
+return
+------
+Plan
+"""
+def plan(sf, command, arg, params):
+    sf.metadata.offline = True
+    p = Plan()
+    if command in ('list', 'accounts'):
+        sf_type = 'Account' if command == 'accounts' else params['sf_type']
+        fields = ACCOUNT_FIELDS if command == 'accounts' else params['fields']
+        query, page_size = compileFields(sf, p, sf_type, fields)
+        if command == 'list' and params['snapshots'] != None:
+            select = 'Id,SystemModstamp,' + ','.join([f for f in query if f.lower() not in ('id', 'systemmodstamp')])
+            p.query('SELECT ' + select + ' FROM ' + sf_type + ('' if params['full'] else ' WHERE SystemModstamp >= <watermark>'))
+            p.query('SELECT Id,SystemModstamp FROM ' + sf_type + ' WHERE IsDeleted = true AND SystemModstamp >= <watermark>',
+                    None, 'queryAll')
+            p.note('without a watermark in ' + params['snapshots'] + ' all records are loaded and no deletes are queried')
+        elif command == 'list' and params['partitions'] != None:
+            p.add('GET', REST + 'query?q=SELECT Id FROM ' + sf_type + ' ORDER BY Id ASC LIMIT 1')
+            p.add('GET', REST + 'query?q=SELECT Id FROM ' + sf_type + ' ORDER BY Id DESC LIMIT 1')
+            bounds = ['<bound %d>' % k for k in range(1, params['partitions'])]
+            for cond in idConditions(bounds):
+                p.query('SELECT ' + ','.join(query) + ' FROM ' + sf_type + ' WHERE ' + cond, page_size)
+        else:
+            p.query('SELECT ' + ','.join(query) + ' FROM ' + sf_type, page_size)
+        target = params['out'] or 'stdout'
+        p.note('output: ' + target + ('' if params['compress'] == None else ' (' + params['compress'] + ')')
+                + ('' if params['format'] == 'csv' else ' as ' + params['format']))
+    elif command == 'delete':
+        ids = arg.split(',')
+        planDelete(sf, p, params['sf_type'], len(ids))
+    elif command == 'clean':
+        p.add('GET', RULE)
+        p.query("SELECT id from DuplicateRecordSet WHERE DuplicateRuleId = '<rule>'")
+        p.add('DELETE', REST + 'composite/sobjects?allOrNone=false&ids=<ids>', None,
+                'one per ' + str(sf.collection_size) + ' sets, Bulk API delete job per ' + str(sf.bulk_threshold) + ' sets')
+    elif command == 'dedup':
+        groups = [group.split(',') for group in arg.split(';')]
+        ids = [i for g in groups for i in g]
+        urls = list(sf.idChunks(REST + 'query?q=SELECT Id FROM Account WHERE Id IN (', ids))
+        p.add('GET', REST + 'query?q=SELECT Id FROM Account WHERE Id IN (<ids>)', len(urls), str(len(ids)) + ' ids')
+        p.add('GET', RULE)
+        planTrees(sf, p, groups)
+    elif command == 'filededup':
+        groups = 0
+        p.add('GET', RULE)
+        for n, dups in enumerate(sf.chunks(sf.duplicateGroups(arg, params['limit']), sf.duplicate_chunk_size)):
+            groups = groups + len(dups)
+            items = sum([len(d) for d in dups])
+            if len(dups) + items < sf.bulk_threshold:
+                planTrees(sf, p, dups)
+            else:
+                p.bulkJob('insert', 'DuplicateRecordSet', len(dups), sf)
+                p.bulkJob('insert', 'DuplicateRecordItem', items, sf)
+        p.note(str(groups) + ' groups in ' + arg)
+    elif command == 'bulk-export':
+        query, page_size = compileFields(sf, p, params['sf_type'], params['fields'])
+        p.add('POST', JOBS + 'query', 1, 'SELECT ' + ','.join(query) + ' FROM ' + params['sf_type'])
+        p.add('GET', JOBS + 'query/<job>', None, 'polls until the job is completed')
+        p.add('GET', JOBS + 'query/<job>/results', None, 'one per result page, written to ' + arg)
+    elif command == 'bulk-load':
+        jobs = max(1, int(math.ceil(os.path.getsize(arg) / 100000000.0)))
+        p.add('POST', JOBS + 'ingest', jobs, params['operation'] + ' ' + params['sf_type'] + ', one job per 100MB of ' + arg)
+        p.add('PUT', JOBS + 'ingest/<job>/batches', jobs)
+        p.add('PATCH', JOBS + 'ingest/<job>', jobs, 'UploadComplete')
+        p.add('GET', JOBS + 'ingest/<job>', None, 'polls until the jobs are completed')
+        p.add('GET', JOBS + 'ingest/<job>/failedResults/', None, 'only jobs with failed records')
+    else:
+        p.note(command + ' is not planned')
+    return p
+
+"""
+helper, plans the deletion of n ids (sObject Collections or Bulk API)
+"""
+def planDelete(sf, p, sf_type, n):
+    if n >= sf.bulk_threshold:
+        p.bulkJob('delete', sf_type, n, sf)
+    else:
+        p.add('DELETE', REST + 'composite/sobjects?allOrNone=false&ids=<ids>',
+                int(math.ceil(n / float(sf.collection_size))), str(n) + ' ids')
+
+"""
+helper, plans the sObject Tree requests of duplicate groups
+"""
+def planTrees(sf, p, groups):
+    if len(groups) == 0:
+        return
+    p.add('POST', REST + 'composite/tree/DuplicateRecordSet/', len(sf.treeChunks(groups)),
+            str(len(groups)) + ' groups, ' + str(sum([len(g) for g in groups])) + ' items')
+    overflow = sum([max(0, len(g) - sf.collection_size + 1) for g in groups])
+    if overflow > 0:
+        p.add('POST', REST + 'composite/sobjects/', int(math.ceil(overflow / float(sf.collection_size))),
+                str(overflow) + ' items that do not fit into a tree')
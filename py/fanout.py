@@ -0,0 +1,39 @@
+# File name: fanout.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+#Salesforce allows 25 concurrent long running requests per org
+MAX_CONCURRENCY = 25
+
+
+"""
+calls func for each item, up to concurrency calls run at the same time
+an exception of one call does not stop the other calls
+
+params
+------
+func:        function with one argument
+items:       list of arguments
+concurrency: int, max number of concurrent calls (limited to MAX_CONCURRENCY),
+             1 calls func serially in the current thread
+
+return
+------
+list of (result, error) in order of items, error is None or the raised exception
+"""
+def fanOut(func, items, concurrency = 1):
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    concurrency = max(1, min(concurrency, MAX_CONCURRENCY, len(items)))
+    if concurrency == 1:
+        return [call(item) for item in items]
+    with ThreadPoolExecutor(max_workers = concurrency) as pool:
+        return list(pool.map(call, items))
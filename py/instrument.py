@@ -0,0 +1,161 @@
+# File name: instrument.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import sys
+import json
+import time
+import threading
+
+
+#upper bounds (seconds) of the latency histogram
+BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+"""
+records each HTTP request of the Session: operation, status, latency, bytes
+sent and received, retries and the API usage (Sforce-Limit-Info header)
+the requests are summarized per operation, with a trace file each request
+is written as one json line
+
+    path: String, trace file (json lines, written line by line), None for the summary only
+"""
+class Recorder():
+    def __init__(self, path = None):
+        self.lock = threading.Lock()
+        self.trace = None if path == None else open(path, 'a', buffering = 1)
+        self.ops = {}
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    """
+    records one request
+
+    params
+    ------
+    op:       String, operation (e.g. GET query, see scheduler.operation)
+    method:   String, GET, POST, ...
+    url:      String, full url
+    r:        response
+    latency:  float, seconds until the response was received (all attempts)
+    retries:  int, number of retries (503, connection errors, 502/504)
+    stream:   bool, the body is streamed (not read yet), its size is taken from the header
+    """
+    def record(self, op, method, url, r, latency, retries, stream = False):
+        sent = int(r.request.headers.get('Content-Length') or 0) if r.request != None else 0
+        if stream:
+            received = int(r.headers.get('Content-Length') or 0)
+        else:
+            received = len(r.content)
+        bucket = 0
+        while bucket < len(BUCKETS) and latency > BUCKETS[bucket]:
+            bucket = bucket + 1
+
+        with self.lock:
+            stats = self.ops.get(op)
+            if stats == None:
+                stats = { 'calls' : 0, 'errors' : 0, 'retries' : 0, 'sent' : 0, 'received' : 0, 'latencies' : [] }
+                self.ops[op] = stats
+            stats['calls'] = stats['calls'] + 1
+            if r.status_code >= 400:
+                stats['errors'] = stats['errors'] + 1
+            stats['retries'] = stats['retries'] + retries
+            stats['sent'] = stats['sent'] + sent
+            stats['received'] = stats['received'] + received
+            stats['latencies'].append(latency)
+            self.histogram[bucket] = self.histogram[bucket] + 1
+            if self.trace != None:
+                self.trace.write(json.dumps({ 'time' : time.time(), 'op' : op, 'method' : method,
+                        'url' : url.split('?')[0], 'status' : r.status_code, 'latency' : round(latency, 6),
+                        'sent' : sent, 'received' : received, 'retries' : retries,
+                        'limit' : r.headers.get('Sforce-Limit-Info') }) + '\n')
+
+    """
+    prints the requests per operation and a histogram of the latencies
+
+    params
+    ------
+    out: stream, default stderr (stdout carries the data)
+    """
+    def report(self, out = None):
+        if out == None:
+            out = sys.stderr
+        with self.lock:
+            print("%-32s %6s %6s %7s %9s %9s %9s %11s %11s" % ('operation', 'calls', 'errors', 'retries',
+                    'p50', 'p95', 'max', 'sent', 'received'), file=out)
+            for op in sorted(self.ops):
+                stats = self.ops[op]
+                latencies = sorted(stats['latencies'])
+                print("%-32s %6d %6d %7d %8.3fs %8.3fs %8.3fs %11d %11d" % (op, stats['calls'], stats['errors'],
+                        stats['retries'], percentile(latencies, 0.5), percentile(latencies, 0.95), latencies[-1],
+                        stats['sent'], stats['received']), file=out)
+            total = sum(self.histogram)
+            if total == 0:
+                return
+            print("latency", file=out)
+            lower = 0.0
+            for upper, count in zip(BUCKETS + [None], self.histogram):
+                label = ("%5.3fs - %5.3fs" % (lower, upper)) if upper != None else (">= %5.3fs" % lower)
+                print("  %-18s %6d %s" % (label, count, '#' * int(round(50.0 * count / total))), file=out)
+                lower = upper
+
+    def close(self):
+        if self.trace != None:
+            self.trace.close()
+            self.trace = None
+
+
+"""
+returns the percentile p (0..1) of sorted values
+"""
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+"""
+profiles selected calls (e.g. the transform of a page) with cProfile
+only one profiler can be active at a time, so the profiled calls of
+concurrent threads are serialized
+"""
+class Profiler():
+    def __init__(self):
+        #only loaded with --profile
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    """
+    calls func(*args) with profiling enabled
+
+    return
+    ------
+    result of func
+    """
+    def call(self, func, *args):
+        with self.lock:
+            self.calls = self.calls + 1
+            self.profile.enable()
+            try:
+                return func(*args)
+            finally:
+                self.profile.disable()
+
+    """
+    prints the functions with the highest cumulative time
+
+    params
+    ------
+    out:   stream, default stderr (stdout carries the data)
+    limit: int, number of functions
+    """
+    def report(self, out = None, limit = 25):
+        if out == None:
+            out = sys.stderr
+        if self.calls == 0:
+            return
+        import pstats
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
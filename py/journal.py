@@ -0,0 +1,169 @@
+# File name: journal.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import os
+import json
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    #no file locking (e.g. Windows)
+    fcntl = None
+
+
+"""
+journal of long running operations (checkpoints), an append only file with
+one json line per entry, each entry is flushed to disk before the next
+request is sent. An interrupted run (timeout, Ctrl-C) continues from the
+checkpoints of the journal (resume), any other run starts a new journal
+
+entries are keyed by operation (e.g. filededup:<file>) and key (e.g. items:3),
+a later entry replaces an earlier one with the same keys. Only the entries
+of the resumed run are returned by get, entries written by this run are not
+(an operation called twice in one run is done twice). The file is compacted
+when it is opened and locked while the journal is open, so a second run with
+the same journal fails instead of removing the checkpoints of the first run
+(each command line has its own journal file, see journalPath). A finished
+run removes its journal, only interrupted runs leave one
+
+    path:   String, journal file, None for a journal of this run only (in memory)
+    resume: bool, keep the entries of the file (else the file is cleared)
+"""
+class Journal():
+    def __init__(self, path = None, resume = False):
+        self.path = path
+        self.lock = threading.Lock()
+        #entries of the resumed run (returned by get) and of this run
+        self.resumed = {}
+        self.entries = {}
+        self.file = None
+        self.lockfile = None
+        if path == None:
+            return
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, 0o700, exist_ok = True)
+        self.lockfile = open(path + '.lock', 'a')
+        if fcntl != None:
+            try:
+                fcntl.flock(self.lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.lockfile.close()
+                self.lockfile = None
+                raise ValueError("journal " + path + " is used by another run")
+        if resume:
+            self.read()
+        self.compact()
+
+    """
+    returns the value of an entry
+
+    params
+    ------
+    op:      String, operation
+    key:     String, key within the operation
+    default: returned if there is no entry
+
+    return
+    ------
+    json value of the resumed run
+    """
+    def get(self, op, key, default = None):
+        with self.lock:
+            return self.resumed.get(op, {}).get(key, default)
+
+    """
+    stores an entry (written to disk before the call returns)
+
+    params
+    ------
+    op:    String, operation
+    key:   String, key within the operation
+    value: json value
+    """
+    def put(self, op, key, value):
+        with self.lock:
+            self.entries.setdefault(op, {})[key] = value
+            self.write({ 'op' : op, 'key' : key, 'value' : value })
+
+    def write(self, entry):
+        if self.file == None:
+            return
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    """
+    reads the entries of the file, an incomplete last line (interrupted
+    write) is ignored
+    """
+    def read(self):
+        try:
+            f = open(self.path, 'r')
+        except IOError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.resumed.setdefault(entry['op'], {})[entry['key']] = entry['value']
+
+    """
+    rewrites the file with the resumed entries only and opens it for appending
+    """
+    def compact(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for op, values in self.resumed.items():
+                for key, value in values.items():
+                    f.write(json.dumps({ 'op' : op, 'key' : key, 'value' : value }) + '\n')
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'a')
+
+    """
+    removes the journal file and its lock file, e.g. after all operations
+    are finished
+    """
+    def remove(self):
+        if self.path == None:
+            return
+        for path in (self.path, self.path + '.lock'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.close()
+
+    def close(self):
+        if self.file != None:
+            self.file.close()
+            self.file = None
+        if self.lockfile != None:
+            #closing releases the lock
+            self.lockfile.close()
+            self.lockfile = None
+
+
+"""
+returns the journal file of a command line, each command line (command and
+the options that change its work) has its own journal, so a run does not
+clear the checkpoints of another one
+
+params
+------
+directory: String, directory of the journals
+command:   json value, the command and its options
+
+return
+------
+String, <directory>/journal-<hash>.jsonl
+"""
+def journalPath(directory, command):
+    key = hashlib.sha1(json.dumps(command, sort_keys = True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, 'journal-' + key + '.jsonl')
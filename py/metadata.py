@@ -0,0 +1,166 @@
+# File name: metadata.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+from cache import Cache
+
+
+#Salesforce returns max 2000 records per query page, min batchSize is 200
+MAX_PAGE_SIZE = 2000
+MIN_PAGE_SIZE = 200
+#memory budget of one query page (estimated from the field lengths)
+PAGE_BYTES = 32 * 1024 * 1024
+#estimated size of a value is its max size, but at least 20 and at most 4000 bytes
+#(long text fields are rarely full)
+MIN_FIELD_BYTES = 20
+MAX_FIELD_BYTES = 4000
+#max levels of a relationship path (Contact.Account.Owner.Name)
+MAX_DEPTH = 5
+#not exported by *, their components are separate fields
+COMPOUND_TYPES = ('address', 'location')
+
+
+"""
+compiled field list of a query, see Metadata.compile
+
+    names:     [], field names per column with the case of the describe metadata,
+               relationship paths joined by '.', "-" for empty columns
+    fields:    String, names joined by ',' (field list of transform.Projection)
+    query:     [], fields to query (without "-" and duplicates)
+    types:     dict field name -> field type (e.g. 'string', 'int', 'datetime')
+    page_size: int, max records per query page (Sforce-Query-Options batchSize)
+"""
+class FieldList():
+    def __init__(self, names, types, page_size):
+        self.names = names
+        self.fields = ",".join(names)
+        self.query = []
+        for n in names:
+            if n != "-" and n not in self.query:
+                self.query.append(n)
+        self.types = types
+        self.page_size = page_size
+
+
+"""
+describe metadata of sobjects, the describe results are cached with a TTL
+(see cache.Cache, in memory or in a sqlite file shared by following runs)
+field lists are compiled against the metadata before a query is sent, so an
+unknown field fails before the first page is fetched
+
+    sf:    Salesforce
+    cache: Cache, cache of the describe results, default in memory
+"""
+class Metadata():
+    def __init__(self, sf, cache = None):
+        self.sf = sf
+        self.cache = cache if cache != None else Cache(ttl = 86400)
+        #if set, only cached describe results are used (--dry-run)
+        self.offline = False
+
+    """
+    returns the describe metadata of an sobject, from the cache if possible
+
+    params
+    ------
+    sf_type: String, Salesforce sobject
+
+    return
+    ------
+    json dict, raises LookupError if offline and not cached
+    """
+    def describe(self, sf_type):
+        key = 'describe:' + self.sf.instance_url + ':' + sf_type.lower()
+        retval = self.cache.getQuery(key)
+        if retval == None and self.offline:
+            raise LookupError("describe of " + sf_type + " is not cached")
+        if retval == None:
+            retval = self.sf.describe(sf_type)
+            self.cache.putQuery(key, 'describe:' + sf_type, retval)
+        return retval
+
+    """
+    validates and expands a field list
+
+    params
+    ------
+    sf_type: String, Salesforce sobject
+    fields:  String, comma separated field names, "-" for an empty field,
+             "*" for all fields, relationship paths like Owner.Name
+
+    return
+    ------
+    FieldList
+    """
+    def compile(self, sf_type, fields):
+        describe = self.describe(sf_type)
+        names = []
+        types = {}
+        selected = []
+        for f in fields.split(","):
+            f = f.strip()
+            if f == "-":
+                names.append("-")
+                continue
+            if f == "*":
+                for field in describe['fields']:
+                    if field['type'] not in COMPOUND_TYPES:
+                        names.append(field['name'])
+                        types[field['name']] = field['type']
+                        selected.append(field)
+                continue
+            name, field = self.resolve(sf_type, f)
+            names.append(name)
+            types[name] = field['type']
+            selected.append(field)
+
+        return FieldList(names, types, self.pageSize(selected))
+
+    """
+    resolves a field or relationship path
+
+    params
+    ------
+    sf_type: String, Salesforce sobject
+    path:    String, field name or relationship path (e.g. Owner.Name)
+
+    return
+    ------
+    name with the case of the metadata, describe of the (last) field
+    """
+    def resolve(self, sf_type, path):
+        parts = path.split(".")
+        if len(parts) > MAX_DEPTH + 1:
+            raise ValueError("relationship path '" + path + "' has more than " + str(MAX_DEPTH) + " levels")
+        describe = self.describe(sf_type)
+        names = []
+        for part in parts[:-1]:
+            relations = [f for f in describe['fields'] if (f.get('relationshipName') or '').lower() == part.lower()]
+            if len(relations) == 0 or len(relations[0].get('referenceTo') or []) == 0:
+                raise ValueError("unknown relationship '" + part + "' of " + describe['name'] + " (in '" + path + "')")
+            names.append(relations[0]['relationshipName'])
+            #polymorphic relationships (e.g. Owner) are resolved with the first type
+            describe = self.describe(relations[0]['referenceTo'][0])
+        for field in describe['fields']:
+            if field['name'].lower() == parts[-1].lower():
+                names.append(field['name'])
+                return ".".join(names), field
+        raise ValueError("unknown field '" + parts[-1] + "' of " + describe['name'] + " (in '" + path + "')")
+
+    """
+    returns the max safe number of records per query page for the fields
+
+    Salesforce limits pages with two or more long text fields to 200 records,
+    other pages are limited by the estimated size of the records (PAGE_BYTES)
+    """
+    def pageSize(self, fields):
+        long_text = [f for f in fields if f['type'] == 'textarea' and f.get('length', 0) > 255]
+        if len(long_text) >= 2:
+            return MIN_PAGE_SIZE
+        size = 0
+        for f in fields:
+            size = size + min(max(f.get('byteLength') or f.get('length') or 0, MIN_FIELD_BYTES), MAX_FIELD_BYTES)
+        if size == 0:
+            return MAX_PAGE_SIZE
+        return max(MIN_PAGE_SIZE, min(MAX_PAGE_SIZE, PAGE_BYTES // size))
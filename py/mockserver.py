@@ -0,0 +1,605 @@
+# File name: mockserver.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+"""
+local stand-in for the Salesforce APIs used by salesforce.py, for benchmarks
+and experiments without an org (and its API limits)
+
+emulated are the OAuth token endpoint, queries with nextRecordsUrl pagination,
+sObject create/read/delete, describe, limits, sObject Collections insert and
+delete, sObject Tree (composite/tree) and the Bulk API (v1) job/batch state
+machine. Queries support the SOQL used by
+salesforce.py: SELECT <fields> FROM <sobject> [WHERE <cond> AND ...]
+[ORDER BY Id ASC|DESC] [LIMIT n], conditions are Id IN (...), = , >, >=, <, <=
+
+usage: python3 mockserver.py [port] [records]
+"""
+
+import re
+import sys
+import json
+import time
+import operator
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from partition import id18
+
+
+#key prefixes of the sobjects, other sobjects get a0X
+PREFIXES = {
+    'Account'             : '001',
+    'User'                : '005',
+    'DuplicateRule'       : '0Bm',
+    'DuplicateRecordSet'  : '0GK',
+    'DuplicateRecordItem' : '0GL',
+}
+
+#child relationships of sObject Tree requests: relationship -> (sobject, field of the parent id)
+CHILDREN = {
+    'DuplicateRecordItems' : ('DuplicateRecordItem', 'DuplicateRecordSetId'),
+}
+#references checked on create: sobject -> field that must name an existing record
+REFERENCES = {
+    'DuplicateRecordItem' : 'RecordId',
+}
+#max records of an sObject Tree or sObject Collections request
+MAX_RECORDS = 200
+
+SELECT = re.compile(r'^SELECT\s+(.+?)\s+FROM\s+(\w+)(?:\s+WHERE\s+(.+?))?(\s+ORDER\s+BY\s+Id(?:\s+(ASC|DESC))?)?(?:\s+LIMIT\s+(\d+))?\s*$', re.I)
+CONDITION = re.compile(r"^\s*([\w.]+)\s*(=|!=|>=|<=|>|<|IN)\s*(.+?)\s*$", re.I)
+OPERATORS = { '=' : operator.eq, '!=' : operator.ne, '>' : operator.gt, '>=' : operator.ge, '<' : operator.lt, '<=' : operator.le }
+
+
+"""
+state of the emulated org, requests are served by a ThreadingHTTPServer
+
+    latency:    float, seconds each request is delayed
+    page_size:  int, records per query page
+    bulk_polls: int, number of polls until a Bulk batch is completed
+    api_limit:  int, daily API requests (Sforce-Limit-Info header)
+"""
+class MockSalesforce():
+    def __init__(self, latency = 0.0, page_size = 2000, bulk_polls = 2, api_limit = 1000000):
+        self.latency = latency
+        self.page_size = page_size
+        self.bulk_polls = bulk_polls
+        self.api_limit = api_limit
+        self.lock = threading.Lock()
+        self.server = None
+        self.url = None
+        self.reset()
+
+    """
+    removes all records, cursors and jobs, creates the DuplicateRule Test_Regel
+    """
+    def reset(self):
+        with self.lock:
+            #records per sobject (keyed by 18 character id), sobject and id by 15 character id
+            self.records = {}
+            self.types = {}
+            self.cursors = {}
+            self.jobs = {}
+            self.requests = 0
+            self.sequence = 0
+        self.create('DuplicateRule', { 'DeveloperName' : 'Test_Regel', 'MasterLabel' : 'Test Regel' })
+
+    """
+    creates count Accounts with Name, the Billing address fields, SystemModstamp and an owner (User)
+
+    return
+    ------
+    list of the created ids
+    """
+    def populate(self, count, sobject = 'Account'):
+        owner = self.create('User', { 'Name' : 'Mock User', 'Email' : 'mock@example.com' })
+        ids = []
+        for i in range(count):
+            ids.append(self.create(sobject, { 'Name' : 'Account ' + str(i), 'BillingCity' : 'Köln',
+                    'BillingStreet' : 'Domkloster ' + str(i % 100 + 1), 'BillingPostalCode' : '50667',
+                    'BillingCountry' : 'Germany', 'Description' : None, 'OwnerId' : owner,
+                    'SystemModstamp' : '2020-01-01T00:00:%02d.000+0000' % (i % 60) }))
+        return ids
+
+    """
+    creates a record
+
+    return
+    ------
+    id of the record (18 characters)
+    """
+    def create(self, sobject, fields):
+        with self.lock:
+            self.sequence = self.sequence + 1
+            i = id18(PREFIXES.get(sobject, 'a0X') + '%012d' % self.sequence)
+            record = { 'attributes' : { 'type' : sobject }, 'Id' : i }
+            record.update(fields)
+            self.records.setdefault(sobject, {})[i] = record
+            self.types[i[:15]] = (sobject, i)
+        return i
+
+    """
+    returns the error of a record that can not be created, None if it is valid
+    """
+    def validate(self, sobject, fields):
+        ref = REFERENCES.get(sobject)
+        if ref != None and self.get(fields.get(ref) or '') == None:
+            return { 'statusCode' : 'INVALID_CROSS_REFERENCE_KEY', 'message' : 'invalid cross reference id', 'fields' : [ref] }
+        return None
+
+    """
+    creates the records of an sObject Tree request, all or none: if a record
+    is invalid, no record is created
+
+    return
+    ------
+    (status, response body)
+    """
+    def tree(self, sobject, records):
+        flat = []
+        def walk(sobject, records, parent):
+            for r in records:
+                fields = dict([(k, v) for k, v in r.items() if k != 'attributes' and k not in CHILDREN])
+                flat.append((sobject, r['attributes']['referenceId'], fields, parent))
+                for rel, (child, key) in CHILDREN.items():
+                    if rel in r:
+                        walk(child, r[rel]['records'], (len(flat) - 1, key))
+        walk(sobject, records, None)
+        if len(flat) > MAX_RECORDS:
+            return 400, [{ 'message' : 'Too many records, max ' + str(MAX_RECORDS), 'errorCode' : 'LIMIT_EXCEEDED' }]
+
+        errors = []
+        for sobject, ref, fields, parent in flat:
+            error = self.validate(sobject, fields)
+            if error != None:
+                errors.append({ 'referenceId' : ref, 'errors' : [error] })
+        if len(errors) > 0:
+            return 400, { 'hasErrors' : True, 'results' : errors }
+
+        ids = []
+        results = []
+        for sobject, ref, fields, parent in flat:
+            if parent != None:
+                fields[parent[1]] = ids[parent[0]]
+            ids.append(self.create(sobject, fields))
+            results.append({ 'referenceId' : ref, 'id' : ids[-1] })
+        return 201, { 'hasErrors' : False, 'results' : results }
+
+    """
+    deletes a record (15 or 18 character id)
+
+    return
+    ------
+    True if the record existed
+    """
+    def delete(self, i):
+        with self.lock:
+            entry = self.types.pop(i[:15], None)
+            if entry == None:
+                return False
+            del self.records[entry[0]][entry[1]]
+            return True
+
+    def get(self, i):
+        with self.lock:
+            entry = self.types.get(i[:15])
+            if entry == None:
+                return None
+            return self.records[entry[0]][entry[1]]
+
+    """
+    runs a query
+
+    return
+    ------
+    list of records (only the selected fields)
+    """
+    def query(self, soql):
+        m = SELECT.match(soql)
+        if m == None:
+            raise ValueError("unsupported query: " + soql)
+        fields = [f.strip() for f in m.group(1).split(',')]
+        with self.lock:
+            records = list(self.records.get(m.group(2), {}).values())
+        if m.group(3) != None:
+            for text in re.split(r'\s+AND\s+', m.group(3), flags = re.I):
+                matches = self.condition(text)
+                records = [r for r in records if matches(r)]
+        if m.group(4) != None:
+            records.sort(key = lambda r: r['Id'], reverse = (m.group(5) or '').upper() == 'DESC')
+        if m.group(6) != None:
+            records = records[:int(m.group(6))]
+        retval = []
+        for r in records:
+            row = { 'attributes' : r['attributes'] }
+            for f in fields:
+                self.select(row, r, f.split('.'))
+            retval.append(row)
+        return retval
+
+    """
+    copies a field or relationship path (as list) from record to row,
+    related records are nested (None if the relationship is empty)
+    """
+    def select(self, row, record, path):
+        if len(path) == 1:
+            name, value = field(record, path[0])
+            row[name] = value
+            return
+        name, reference = field(record, path[0] + 'Id')
+        related = None if reference == None else self.get(reference)
+        key = name[:-2]
+        if related == None:
+            row[key] = None
+            return
+        if row.get(key) == None:
+            row[key] = { 'attributes' : related['attributes'] }
+        self.select(row[key], related, path[1:])
+
+    """
+    returns a function that returns True if a record matches a condition (field op value)
+    """
+    def condition(self, text):
+        m = CONDITION.match(text)
+        if m == None:
+            raise ValueError("unsupported condition: " + text)
+        name, op, literal = m.group(1), m.group(2).upper(), m.group(3)
+        if name.lower() == 'isdeleted':
+            #deleted records are not kept
+            return lambda r: literal.lower() == 'false'
+        if op == 'IN':
+            values = set([v.strip().strip("'") for v in literal.strip('()').split(',')])
+            def isIn(r):
+                value = field(r, name)[1]
+                return value != None and (value in values or value[:15] in values)
+            return isIn
+        literal = literal.strip("'")
+        #ids are compared by 15 characters, datetimes up to the seconds
+        length = None
+        if name.lower() == 'id':
+            length = 15
+        elif re.match(r'^\d{4}-\d\d-\d\dT', literal):
+            length = 19
+        if length != None:
+            literal = literal[:length]
+        compare = OPERATORS[op]
+        def matches(r):
+            value = field(r, name)[1]
+            if value == None:
+                return op == '=' and literal == 'null'
+            if length != None:
+                value = value[:length]
+            return compare(value, literal)
+        return matches
+
+    """
+    returns the first page of a query result, the following pages are kept as cursor
+
+    params
+    ------
+    rows:       [], records of the result
+    batch_size: int, requested page size (Sforce-Query-Options), None for self.page_size
+    """
+    def page(self, rows, batch_size = None):
+        size = self.page_size if batch_size == None else min(self.page_size, batch_size)
+        with self.lock:
+            key = 'c%d' % len(self.cursors)
+            self.cursors[key] = (rows, size)
+        return self.cursorPage(key, 0)
+
+    def cursorPage(self, key, start):
+        with self.lock:
+            rows, size = self.cursors[key]
+        end = start + size
+        body = { 'totalSize' : len(rows), 'done' : end >= len(rows), 'records' : rows[start:end] }
+        if end < len(rows):
+            body['nextRecordsUrl'] = '/services/data/v42.0/query/' + key + '-' + str(end)
+        return body
+
+    """
+    creates a Bulk job (v1)
+    """
+    def createJob(self, spec):
+        with self.lock:
+            key = '750%012d' % len(self.jobs)
+            job = { 'id' : key, 'operation' : spec['operation'], 'object' : spec['object'], 'state' : 'Open', 'batches' : [] }
+            self.jobs[key] = job
+        return job
+
+    def addBatch(self, job, records):
+        with self.lock:
+            batch = { 'id' : '751%012d' % len(job['batches']), 'records' : records, 'polls' : 0, 'results' : None }
+            job['batches'].append(batch)
+        return batch
+
+    """
+    returns the state of a batch, a batch is completed after self.bulk_polls polls,
+    its records are processed then
+    """
+    def pollBatch(self, job, batch):
+        batch['polls'] = batch['polls'] + 1
+        if batch['results'] == None and batch['polls'] > self.bulk_polls:
+            batch['results'] = [self.process(job, r) for r in batch['records']]
+        return self.batchInfo(batch)
+
+    def batchInfo(self, batch):
+        done = batch['results'] != None
+        failed = 0 if not done else len([r for r in batch['results'] if not r['success']])
+        return { 'id' : batch['id'], 'state' : 'Completed' if done else ('InProgress' if batch['polls'] > 0 else 'Queued'),
+                'numberRecordsProcessed' : len(batch['records']) if done else 0, 'numberRecordsFailed' : failed }
+
+    def process(self, job, record):
+        if job['operation'] == 'delete':
+            if self.delete(record['Id']):
+                return { 'id' : record['Id'], 'success' : True, 'created' : False, 'errors' : [] }
+            return { 'id' : None, 'success' : False, 'created' : False,
+                    'errors' : [{ 'message' : 'entity is deleted', 'statusCode' : 'ENTITY_IS_DELETED', 'fields' : [] }] }
+        i = self.create(job['object'], record)
+        return { 'id' : i, 'success' : True, 'created' : True, 'errors' : [] }
+
+    """
+    returns the job info, each poll of the job advances its batches
+    """
+    def jobInfo(self, job):
+        infos = [self.pollBatch(job, b) for b in job['batches']]
+        completed = len([i for i in infos if i['state'] == 'Completed'])
+        return { 'id' : job['id'], 'operation' : job['operation'], 'object' : job['object'], 'state' : job['state'],
+                'numberBatchesTotal' : len(infos), 'numberBatchesCompleted' : completed, 'numberBatchesFailed' : 0,
+                'numberBatchesQueued' : len([i for i in infos if i['state'] == 'Queued']),
+                'numberBatchesInProgress' : len([i for i in infos if i['state'] == 'InProgress']),
+                'numberRecordsProcessed' : sum([i['numberRecordsProcessed'] for i in infos]),
+                'numberRecordsFailed' : sum([i['numberRecordsFailed'] for i in infos]) }
+
+    """
+    starts the server in a background thread
+
+    params
+    ------
+    port: int, 0 for a free port
+
+    return
+    ------
+    url of the server (e.g. http://127.0.0.1:8080)
+    """
+    def start(self, port = 0):
+        mock = self
+
+        class Handler(RequestHandler):
+            server_version = 'MockSalesforce'
+        Handler.mock = mock
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:' + str(self.server.server_port)
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        return self.url
+
+    def stop(self):
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+"""
+handles the requests of one connection (keep alive), dispatches by method and path
+"""
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    #send the response in one segment (no delayed ack between header and body)
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    mock = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body = None, headers = None):
+        data = b'' if body == None else json.dumps(body).encode('utf-8')
+        with self.mock.lock:
+            self.mock.requests = self.mock.requests + 1
+            usage = self.mock.requests
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Sforce-Limit-Info', 'api-usage=' + str(usage) + '/' + str(self.mock.api_limit))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def error(self, status, message, code = 'NOT_FOUND'):
+        self.send(status, [{ 'message' : message, 'errorCode' : code }])
+
+    def body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length)
+        return None if len(data) == 0 else json.loads(data)
+
+    """
+    common handling, returns the parsed path and query parameters or None if
+    the request is rejected (no session)
+    """
+    def prepare(self):
+        if self.mock.latency > 0:
+            time.sleep(self.mock.latency)
+        url = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        if 'oauth2/token' in url.path:
+            return url.path, params
+        if self.headers.get('Authorization') == None and self.headers.get('X-SFDC-Session') == None:
+            self.body()
+            self.error(401, 'Session expired or invalid', 'INVALID_SESSION_ID')
+            return None
+        return url.path, params
+
+    def do_GET(self):
+        prepared = self.prepare()
+        if prepared == None:
+            return
+        path, params = prepared
+        try:
+            self.get(path, params)
+        except ValueError as e:
+            self.error(400, str(e), 'MALFORMED_QUERY')
+
+    def get(self, path, params):
+        m = re.match(r'^/services/data/v[\d.]+/(query|queryAll)/?$', path)
+        if m != None and 'q' in params:
+            m = re.search(r'batchSize=(\d+)', self.headers.get('Sforce-Query-Options') or '')
+            return self.send(200, self.mock.page(self.mock.query(params['q'][0]), None if m == None else int(m.group(1))))
+        m = re.match(r'^/services/data/v[\d.]+/query/(\w+)-(\d+)$', path)
+        if m != None:
+            return self.send(200, self.mock.cursorPage(m.group(1), int(m.group(2))))
+        if re.match(r'^/services/data/v[\d.]+/limits/?$', path):
+            return self.send(200, { 'DailyApiRequests' : { 'Max' : self.mock.api_limit, 'Remaining' : self.mock.api_limit - self.mock.requests } })
+        m = re.match(r'^/services/data/v[\d.]+/sobjects/(\w+)/describe/?$', path)
+        if m != None:
+            return self.send(200, describe(m.group(1)))
+        m = re.match(r'^/services/data/v[\d.]+/sobjects/(\w+)/(\w+)/?$', path)
+        if m != None:
+            record = self.mock.get(m.group(2))
+            if record == None:
+                return self.error(404, 'The requested resource does not exist')
+            return self.send(200, record)
+        m = re.match(r'^/services/async/[\d.]+/job/(\w+)(/batch(?:/(\w+)(/result)?)?)?$', path)
+        if m != None:
+            job = self.mock.jobs.get(m.group(1))
+            if job == None:
+                return self.error(400, 'Unable to find job', 'InvalidJob')
+            if m.group(2) == None:
+                return self.send(200, self.mock.jobInfo(job))
+            if m.group(3) == None:
+                return self.send(200, { 'batchInfo' : [self.mock.batchInfo(b) for b in job['batches']] })
+            batch = [b for b in job['batches'] if b['id'] == m.group(3)]
+            if len(batch) == 0:
+                return self.error(400, 'Unable to find batch', 'InvalidBatch')
+            if m.group(4) == None:
+                return self.send(200, self.mock.pollBatch(job, batch[0]))
+            if batch[0]['results'] == None:
+                return self.error(400, 'Batch not completed', 'InvalidBatch')
+            return self.send(200, batch[0]['results'])
+        self.error(404, 'The requested resource does not exist')
+
+    def do_POST(self):
+        prepared = self.prepare()
+        if prepared == None:
+            return
+        path, params = prepared
+        if 'oauth2/token' in path:
+            #form encoded credentials
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            return self.send(200, { 'access_token' : 'mock-token', 'instance_url' : self.mock.url,
+                    'token_type' : 'Bearer', 'issued_at' : str(int(time.time() * 1000)) })
+        body = self.body()
+        m = re.match(r'^/services/data/v[\d.]+/sobjects/(\w+)/?$', path)
+        if m != None:
+            return self.send(201, { 'id' : self.mock.create(m.group(1), body), 'success' : True, 'errors' : [] })
+        m = re.match(r'^/services/data/v[\d.]+/composite/tree/(\w+)/?$', path)
+        if m != None:
+            status, result = self.mock.tree(m.group(1), body['records'])
+            return self.send(status, result)
+        if re.match(r'^/services/data/v[\d.]+/composite/sobjects/?$', path):
+            if len(body['records']) > MAX_RECORDS:
+                return self.error(400, 'Too many records, max ' + str(MAX_RECORDS), 'LIMIT_EXCEEDED')
+            results = []
+            for r in body['records']:
+                sobject = r['attributes']['type']
+                fields = dict([(k, v) for k, v in r.items() if k != 'attributes'])
+                error = self.mock.validate(sobject, fields)
+                if error != None:
+                    results.append({ 'id' : None, 'success' : False, 'errors' : [error] })
+                else:
+                    results.append({ 'id' : self.mock.create(sobject, fields), 'success' : True, 'errors' : [] })
+            return self.send(200, results)
+        if re.match(r'^/services/async/[\d.]+/job/?$', path):
+            job = self.mock.createJob(body)
+            return self.send(201, { 'id' : job['id'], 'operation' : job['operation'], 'object' : job['object'], 'state' : 'Open' })
+        m = re.match(r'^/services/async/[\d.]+/job/(\w+)(/batch)?/?$', path)
+        if m != None:
+            job = self.mock.jobs.get(m.group(1))
+            if job == None:
+                return self.error(400, 'Unable to find job', 'InvalidJob')
+            if m.group(2) == None:
+                job['state'] = body['state']
+                return self.send(200, { 'id' : job['id'], 'state' : job['state'] })
+            if job['state'] != 'Open':
+                return self.error(400, 'Job is not open', 'InvalidJobState')
+            batch = self.mock.addBatch(job, body)
+            return self.send(201, self.mock.batchInfo(batch))
+        self.error(404, 'The requested resource does not exist')
+
+    def do_DELETE(self):
+        prepared = self.prepare()
+        if prepared == None:
+            return
+        path, params = prepared
+        if re.match(r'^/services/data/v[\d.]+/composite/sobjects/?$', path):
+            results = []
+            for i in params.get('ids', [''])[0].split(','):
+                if self.mock.delete(i):
+                    results.append({ 'id' : i, 'success' : True, 'errors' : [] })
+                else:
+                    results.append({ 'id' : i, 'success' : False,
+                            'errors' : [{ 'message' : 'entity is deleted', 'statusCode' : 'ENTITY_IS_DELETED', 'fields' : [] }] })
+            return self.send(200, results)
+        m = re.match(r'^/services/data/v[\d.]+/sobjects/(\w+)/(\w+)/?$', path)
+        if m != None:
+            if self.mock.delete(m.group(2)):
+                return self.send(204)
+            return self.error(404, 'entity is deleted', 'ENTITY_IS_DELETED')
+        self.error(404, 'The requested resource does not exist')
+
+
+"""
+returns the name (as stored) and the value of a field, field names are case insensitive
+"""
+def field(record, name):
+    if name in record:
+        return name, record[name]
+    for key, value in record.items():
+        if key.lower() == name.lower():
+            return key, value
+    return name, None
+
+"""
+returns the describe metadata of the emulated sobjects
+"""
+def describe(sobject):
+    fields = [
+        { 'name' : 'Id', 'type' : 'id', 'length' : 18, 'byteLength' : 18 },
+        { 'name' : 'Name', 'type' : 'string', 'length' : 255, 'byteLength' : 765 },
+    ]
+    if sobject == 'User':
+        fields.append({ 'name' : 'Email', 'type' : 'email', 'length' : 80, 'byteLength' : 240 })
+    else:
+        fields.extend([
+            { 'name' : 'BillingCity', 'type' : 'string', 'length' : 40, 'byteLength' : 120 },
+            #fields of salesforce.py accounts
+            { 'name' : 'BillingCountry', 'type' : 'string', 'length' : 80, 'byteLength' : 240 },
+            { 'name' : 'BillingStreet', 'type' : 'string', 'length' : 255, 'byteLength' : 765 },
+            { 'name' : 'BillingPostalCode', 'type' : 'string', 'length' : 20, 'byteLength' : 60 },
+            { 'name' : 'Description', 'type' : 'textarea', 'length' : 32000, 'byteLength' : 96000 },
+            { 'name' : 'OwnerId', 'type' : 'reference', 'length' : 18, 'byteLength' : 18,
+              'relationshipName' : 'Owner', 'referenceTo' : ['User'] },
+            { 'name' : 'SystemModstamp', 'type' : 'datetime', 'length' : 0, 'byteLength' : 0 },
+        ])
+    return { 'name' : sobject, 'fields' : fields }
+
+
+def main(argv):
+    port = int(argv[0]) if len(argv) > 0 else 8080
+    records = int(argv[1]) if len(argv) > 1 else 10000
+    mock = MockSalesforce()
+    mock.populate(records)
+    print("serving", records, "Accounts on", mock.start(port), file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
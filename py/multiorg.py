@@ -0,0 +1,362 @@
+# File name: multiorg.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+"""
+runs the same operation (list, delete, clean, filededup) against several orgs
+at the same time, e.g. a dozen sandboxes and production. Each org has its own
+session, scheduler (rate limits) and recorder, the orgs are logged in and
+processed in a thread pool, the results and timings of all orgs are printed
+as one report
+
+config file (json), string values may reference environment variables ($VAR):
+
+    {
+        "orgs" : [
+            { "name"           : "prod",
+              "base"           : "https://login.salesforce.com/services/oauth2/token",
+              "client_id"      : "...",
+              "client_secret"  : "...",
+              "username"       : "admin@example.com",
+              "password"       : "$PROD_PASSWORD",
+              "security_token" : "...",
+              "rate"           : 10 },
+            ...
+        ]
+    }
+
+    name: unique name of the org, used in log messages, output files and journals
+    rate: optional, max requests per second of the org (see scheduler.Scheduler)
+    other keys are the credentials of auth.Auth
+
+usage: python3 multiorg.py --config <file> [options] <operation>
+    operations:
+        -l|--list:                list all objects of sf_type, csv output to --out
+        --delete <ids>:           delete the ids (e.g. ids copied to full sandboxes), sf_type must be set
+        --clean:                  delete all "Test_Regel" DuplicateRecordSets
+        --filededup <file>:       create the duplicate groups of the file
+    options:
+        -s|--sf_type <sf_object>: sobject of --list, --delete
+        -f|--fields <fields>:     fields of --list (default Id)
+        --out <file>:             output of --list, {org} is replaced by the name of the org
+                                    (default {org}.csv)
+        --compress <gzip|zstd>:   compress the output of --list
+        --limit <n>:              max number of groups of --filededup
+        --workers <n>:            orgs processed at the same time (default 4)
+        --concurrency <n>:        concurrent requests per org (max 25)
+        --orgs <names>:           comma separated names, only these orgs of the config
+        --resume:                 continue interrupted runs, each org and command line has its
+                                    journal in ~/.sfconnect/journals
+        --no-token-cache:         always login, do not reuse cached tokens
+        --stats:                  print the requests per operation of each org
+        -v|--verbose, -q|--quiet: log level
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import getopt
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import Auth, CREDENTIALS
+from cache import Cache
+from fanout import MAX_CONCURRENCY
+from journal import Journal, journalPath
+from metadata import Metadata
+from scheduler import Scheduler
+from instrument import Recorder
+from session import Session
+from tokencache import TokenCache
+from salesforce import Salesforce
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('list', 'delete', 'clean', 'filededup')
+
+
+"""
+reads the orgs of a config file
+
+params
+------
+path:  String, json config file
+names: [], names of the orgs to be returned, None for all orgs
+
+return
+------
+list of org dicts (name, rate, credentials), in order of the file
+"""
+def loadConfig(path, names = None):
+    with open(path, 'r') as f:
+        config = json.load(f)
+    orgs = []
+    for entry in config['orgs']:
+        if 'name' not in entry:
+            raise ValueError("org without name in " + path)
+        if len([o for o in orgs if o['name'] == entry['name']]) > 0:
+            raise ValueError("duplicate org '" + entry['name'] + "' in " + path)
+        credentials = {}
+        for key, value in entry.items():
+            if key in ('name', 'rate'):
+                continue
+            if key not in CREDENTIALS:
+                raise ValueError("unknown key '" + key + "' of org '" + entry['name'] + "'")
+            credentials[key] = os.path.expandvars(value) if isinstance(value, str) else value
+        orgs.append({ 'name' : entry['name'], 'rate' : entry.get('rate'), 'credentials' : credentials })
+
+    if names != None:
+        unknown = [n for n in names if n not in [o['name'] for o in orgs]]
+        if len(unknown) > 0:
+            raise ValueError("unknown org '" + "', '".join(unknown) + "' (not in " + path + ")")
+        orgs = [o for o in orgs if o['name'] in names]
+    return orgs
+
+
+"""
+an org of the config with its own session, scheduler and recorder, the
+Salesforce client is created on login
+
+    org:      dict, see loadConfig
+    settings: dict, see MultiOrg
+"""
+class Org():
+    def __init__(self, org, settings):
+        self.name = org['name']
+        self.settings = settings
+        self.scheduler = Scheduler(rate = org.get('rate'))
+        self.recorder = Recorder()
+        self.session = Session(pool_size = max(10, settings['concurrency']), scheduler = self.scheduler, recorder = self.recorder)
+        self.auth = Auth(self.session, settings['token_cache'], org['credentials'])
+        self.sf = None
+
+    """
+    logs in and prepares the Salesforce client, the journal of the org is
+    keyed by the operation and its params
+    """
+    def login(self, operation, params):
+        token, url = self.auth.auth()
+        sf = Salesforce(token, url, session = self.session, auth = self.auth)
+        sf.concurrency = self.settings['concurrency']
+        journal = journalPath(self.settings['journal_dir'], [self.name, operation, params])
+        sf.journal = Journal(journal, self.settings['resume'])
+        if self.settings['describe'] != None:
+            sf.metadata = Metadata(sf, self.settings['describe'])
+        self.sf = sf
+
+    """
+    runs the operation
+
+    params
+    ------
+    operation: String, see OPERATIONS
+    params:    dict, sf_type, fields, ids, out, compress, filename, limit
+
+    return
+    ------
+    number of processed records (exported, deleted or created)
+    """
+    def run(self, operation, params):
+        if operation == 'list':
+            out = params['out'].replace('{org}', self.name)
+            return self.sf.listObjectsCsv(params['sf_type'], params['fields'], out, params['compress'])
+        if operation == 'delete':
+            return self.sf.delete(params['sf_type'], params['ids'])
+        if operation == 'clean':
+            return self.sf.clean('Test_Regel')
+        if operation == 'filededup':
+            return self.sf.createDuplicatesFromFile(params['filename'], params['limit'])
+        raise ValueError("unknown operation '" + operation + "', use " + ", ".join(OPERATIONS))
+
+    def close(self):
+        if self.sf != None:
+            self.sf.journal.close()
+        self.session.close()
+
+
+"""
+runs one operation against several orgs, up to workers orgs at the same time,
+an error of one org does not stop the other orgs
+
+    orgs:     [], org dicts, see loadConfig
+    workers:  int, orgs processed at the same time
+    settings: dict
+        concurrency: int, concurrent requests per org
+        token_cache: TokenCache, None to always login
+        journal_dir: String, directory of the journals of the orgs
+        resume:      bool, continue interrupted runs from the journals
+        describe:    Cache, describe metadata shared by the orgs (keyed by
+                     instance url), None for a cache per org in memory
+"""
+class MultiOrg():
+    def __init__(self, orgs, workers = 4, settings = None):
+        self.settings = { 'concurrency' : 1, 'token_cache' : None, 'journal_dir' : '.', 'resume' : False, 'describe' : None }
+        self.settings.update(settings or {})
+        self.workers = workers
+        self.orgs = [Org(org, self.settings) for org in orgs]
+
+    """
+    logs in and runs the operation for each org
+
+    params
+    ------
+    operation: String, see OPERATIONS
+    params:    dict, see Org.run
+
+    return
+    ------
+    list of results (dicts) in order of the orgs:
+        org, status (ok or the error), records, login and run seconds, requests, errors, retries, API usage
+    """
+    def run(self, operation, params):
+        if operation == 'list' and '{org}' not in params['out']:
+            #the orgs would write the same file
+            raise ValueError("--out must contain {org}")
+
+        def runOrg(org):
+            #log messages are prefixed by the thread name
+            threading.current_thread().name = org.name
+            result = { 'org' : org.name, 'status' : 'ok', 'records' : 0, 'login' : 0.0, 'seconds' : 0.0 }
+            start = time.perf_counter()
+            try:
+                org.login(operation, params)
+                result['login'] = time.perf_counter() - start
+                result['records'] = org.run(operation, params)
+                #finished, nothing to resume
+                org.sf.journal.remove()
+            except Exception as e:
+                #the login url carries the credentials
+                message = re.sub(r'\?\S*', '', str(e)).strip() or type(e).__name__
+                logger.error("%s failed: %s", org.name, message)
+                result['status'] = message
+            result['seconds'] = time.perf_counter() - start
+            ops = org.recorder.ops.values()
+            result['requests'] = sum([stats['calls'] for stats in ops])
+            result['errors'] = sum([stats['errors'] for stats in ops])
+            result['retries'] = sum([stats['retries'] for stats in ops])
+            result['used'] = org.scheduler.used
+            result['limit'] = org.scheduler.limit
+            return result
+
+        with ThreadPoolExecutor(max_workers = max(1, min(self.workers, len(self.orgs)))) as pool:
+            return list(pool.map(runOrg, self.orgs))
+
+    def close(self):
+        for org in self.orgs:
+            org.close()
+
+
+"""
+prints the results of MultiOrg.run, one line per org and the total
+
+params
+------
+results: [], see MultiOrg.run
+out:     stream, default stderr (stdout carries the data)
+"""
+def report(results, out = None):
+    if out == None:
+        out = sys.stderr
+    print("%-20s %-6s %9s %8s %8s %8s %7s %7s %15s" % ('org', 'status', 'records', 'login', 'time',
+            'requests', 'errors', 'retries', 'API usage'), file=out)
+    for r in results:
+        usage = '-' if r['limit'] == None else "%d/%d" % (r['used'], r['limit'])
+        status = 'ok' if r['status'] == 'ok' else 'failed'
+        print("%-20s %-6s %9d %7.2fs %7.2fs %8d %7d %7d %15s" % (r['org'], status, r['records'] or 0, r['login'],
+                r['seconds'], r['requests'], r['errors'], r['retries'], usage), file=out)
+    failed = [r for r in results if r['status'] != 'ok']
+    print("%-20s %-6s %9d %8s %7.2fs %8d %7d %7d" % ('total', '%d/%d' % (len(results) - len(failed), len(results)),
+            sum([r['records'] or 0 for r in results]), '', max([r['seconds'] for r in results] + [0.0]),
+            sum([r['requests'] for r in results]), sum([r['errors'] for r in results]),
+            sum([r['retries'] for r in results])), file=out)
+    for r in failed:
+        print("%s: %s" % (r['org'], r['status']), file=out)
+
+def usage():
+    print(__doc__[__doc__.index('usage:'):])
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "ls:f:vq", ['config=', 'list', 'delete=', 'clean', 'filededup=', \
+                'sf_type=', 'fields=', 'out=', 'compress=', 'limit=', 'workers=', 'concurrency=', \
+                'orgs=', 'resume', 'no-token-cache', 'stats', 'verbose', 'quiet'])
+    except getopt.GetoptError:
+        usage()
+        return
+    config = None
+    names = None
+    operation = None
+    workers = 4
+    stats = False
+    level = logging.INFO
+    base = os.path.join(os.path.expanduser('~'), '.sfconnect')
+    settings = { 'token_cache' : TokenCache(), 'journal_dir' : os.path.join(base, 'journals') }
+    params = { 'sf_type' : None, 'fields' : 'Id', 'ids' : None, 'out' : '{org}.csv', 'compress' : None,
+            'filename' : None, 'limit' : None }
+    for opt, arg in opts:
+        if opt in (['--config']):
+            config = arg
+        if opt in (['--orgs']):
+            names = arg.split(',')
+        if opt in ('-l', '--list'):
+            operation = 'list'
+        if opt in (['--delete']):
+            operation = 'delete'
+            params['ids'] = arg
+        if opt in (['--clean']):
+            operation = 'clean'
+        if opt in (['--filededup']):
+            operation = 'filededup'
+            params['filename'] = arg
+        if opt in ('-s', '--sf_type'):
+            params['sf_type'] = arg
+        if opt in ('-f', '--fields'):
+            params['fields'] = arg
+        if opt in (['--out']):
+            params['out'] = arg
+        if opt in (['--compress']):
+            params['compress'] = arg
+        if opt in (['--limit']):
+            params['limit'] = int(arg)
+        if opt in (['--workers']):
+            workers = int(arg)
+        if opt in (['--concurrency']):
+            settings['concurrency'] = min(int(arg), MAX_CONCURRENCY)
+        if opt in (['--resume']):
+            settings['resume'] = True
+        if opt in (['--no-token-cache']):
+            settings['token_cache'] = None
+        if opt in (['--stats']):
+            stats = True
+        if opt in ('-v', '--verbose'):
+            level = logging.DEBUG
+        if opt in ('-q', '--quiet'):
+            level = logging.WARNING
+    if config == None or operation == None or (operation in ('list', 'delete') and params['sf_type'] == None) \
+            or (params['limit'] != None and params['limit'] < 1):
+        usage()
+        return
+
+    logging.basicConfig(stream = sys.stderr, level = level, format = '%(levelname)s: %(threadName)s: %(message)s')
+    #urllib3 logs the urls of the requests
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    settings['describe'] = Cache(os.path.join(base, 'describe.sqlite'), 86400)
+    runner = MultiOrg(loadConfig(config, names), workers, settings)
+    try:
+        results = runner.run(operation, params)
+    finally:
+        runner.close()
+    report(results)
+    if stats:
+        for org in runner.orgs:
+            print(org.name, file=sys.stderr)
+            org.recorder.report()
+    if len([r for r in results if r['status'] != 'ok']) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+# File name: partition.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+"""
+Id ranges of an sobject for partitioned (parallel) queries
+
+Salesforce ids are base62 numbers (0-9, A-Z, a-z in ASCII order), the first 3
+characters are the key prefix of the sobject. The ranges are interpolated
+between the lowest and the highest id of the sobject, so they are only of
+similar size if the ids are evenly spread. The queries
+
+    Id <= b1, Id > b1 AND Id <= b2, ..., Id > b(n-1)
+
+return each record exactly once, whatever the spread of the ids
+"""
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+SUFFIX = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ012345'
+
+"""
+returns the number of the first 15 characters of an id
+"""
+def idToInt(i):
+    n = 0
+    for c in i[:15]:
+        n = n * 62 + DIGITS.index(c)
+    return n
+
+"""
+returns the 18 character id of a number
+"""
+def intToId(n):
+    chars = []
+    for k in range(15):
+        n, d = divmod(n, 62)
+        chars.append(DIGITS[d])
+    return id18(''.join(reversed(chars)))
+
+"""
+returns the 18 character id of a 15 character id, the suffix encodes
+which characters are upper case (case insensitive unique)
+"""
+def id18(i):
+    suffix = ''
+    for start in range(0, 15, 5):
+        bits = 0
+        for k, c in enumerate(i[start:start + 5]):
+            if 'A' <= c <= 'Z':
+                bits = bits | (1 << k)
+        suffix = suffix + SUFFIX[bits]
+    return i[:15] + suffix
+
+"""
+returns the bounds of n Id ranges between the lowest and the highest id
+
+params
+------
+low:  String, lowest id of the sobject
+high: String, highest id of the sobject
+n:    int, number of ranges
+
+return
+------
+list of n - 1 ids (18 characters), ascending, without duplicates (less
+ranges if there are not enough ids between low and high)
+"""
+def idBounds(low, high, n):
+    first = idToInt(low)
+    last = idToInt(high)
+    bounds = []
+    for k in range(1, n):
+        b = first + (last - first) * k // n
+        if b > first and (len(bounds) == 0 or b > bounds[-1]):
+            bounds.append(b)
+    return [intToId(b) for b in bounds if b < last]
+
+"""
+returns the SOQL conditions of the Id ranges
+
+params
+------
+bounds: [], ids as returned by idBounds
+
+return
+------
+list of len(bounds) + 1 conditions (e.g. Id > '001...' AND Id <= '001...')
+"""
+def idConditions(bounds):
+    retval = []
+    lower = None
+    for b in bounds + [None]:
+        cond = []
+        if lower != None:
+            cond.append("Id > '" + lower + "'")
+        if b != None:
+            cond.append("Id <= '" + b + "'")
+        retval.append(' AND '.join(cond))
+        lower = b
+    return retval
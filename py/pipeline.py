@@ -0,0 +1,124 @@
+# File name: pipeline.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import sys
+import time
+import queue
+import threading
+
+
+"""
+collects timings of a fetch/process pipeline
+
+    network: seconds spent in requests (in the fetcher)
+    blocked: seconds the consumer waited for the next page
+    process: seconds the consumer spent between two pages
+"""
+class PipelineStats():
+    def __init__(self):
+        self.pages = 0
+        self.network = 0.0
+        self.blocked = 0.0
+        self.process = 0.0
+        self.start = time.perf_counter()
+
+    """
+    prints a short report
+
+    params
+    ------
+    out: stream, default stderr (stdout carries the data)
+    """
+    def report(self, out = None):
+        if out == None:
+            out = sys.stderr
+        total = time.perf_counter() - self.start
+        print("pages:            %d" % self.pages, file=out)
+        print("network (fetch):  %.3fs" % self.network, file=out)
+        print("blocked on fetch: %.3fs" % self.blocked, file=out)
+        print("processing:       %.3fs" % self.process, file=out)
+        print("wall time:        %.3fs" % total, file=out)
+
+
+"""
+iterates over pages, fetching the following pages in a background thread
+while the current one is processed
+
+the queue is bounded by depth, so at most depth pages are held in memory
+besides the one in processing. With depth 0 the pages are fetched
+synchronously (only the timings are collected)
+"""
+class Prefetcher():
+    def __init__(self, pages, depth = 1, stats = None):
+        self.pages = pages
+        self.depth = depth
+        self.stats = stats if stats != None else PipelineStats()
+        self.stop = threading.Event()
+
+    """
+    runs in the background thread, puts each page into the queue
+    the end of the pages is marked with (None, None), an error with (None, exc)
+    """
+    def fetch(self, q):
+        try:
+            while not self.stop.is_set():
+                t = time.perf_counter()
+                try:
+                    page = next(self.pages)
+                except StopIteration:
+                    break
+                self.stats.network += time.perf_counter() - t
+                self.put(q, (page, None))
+            self.put(q, (None, None))
+        except Exception as e:
+            self.put(q, (None, e))
+
+    def put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        if self.depth <= 0:
+            return self.serial()
+        return self.parallel()
+
+    def serial(self):
+        while True:
+            t = time.perf_counter()
+            try:
+                page = next(self.pages)
+            except StopIteration:
+                return
+            done = time.perf_counter()
+            self.stats.network += done - t
+            self.stats.blocked += done - t
+            self.stats.pages += 1
+            yield page
+            self.stats.process += time.perf_counter() - done
+
+    def parallel(self):
+        q = queue.Queue(self.depth)
+        fetcher = threading.Thread(target=self.fetch, args=(q,), daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                t = time.perf_counter()
+                page, error = q.get()
+                done = time.perf_counter()
+                self.stats.blocked += done - t
+                if error != None:
+                    raise error
+                if page == None:
+                    return
+                self.stats.pages += 1
+                yield page
+                self.stats.process += time.perf_counter() - done
+        finally:
+            #consumer stopped early (or failed), release the fetcher
+            self.stop.set()
@@ -0,0 +1,55 @@
+# File name: polling.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import time
+import random
+
+
+"""
+polling strategy with exponential backoff and jitter
+the first poll is done immediately, then the interval starts with initial
+and is multiplied by factor after each poll, up to max_interval
+
+    initial:      float, first interval in seconds
+    factor:       float, growth of the interval per poll
+    max_interval: float, upper bound of an interval in seconds
+    max_wait:     float, total time in seconds until polling gives up (None: no limit,
+                  Bulk jobs can run for hours)
+    jitter:       float, interval is randomized by +/- jitter (fraction of the interval)
+"""
+class Backoff():
+    def __init__(self, initial = 0.5, factor = 2.0, max_interval = 30.0, max_wait = None, jitter = 0.1):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.max_wait = max_wait
+        self.jitter = jitter
+
+    """
+    calls check until it returns a value other than None
+
+    params
+    ------
+    check: function without arguments, returns None while not finished
+
+    return
+    ------
+    the value returned by check
+    """
+    def poll(self, check):
+        start = time.monotonic()
+        interval = self.initial
+        while True:
+            result = check()
+            if result != None:
+                return result
+            elapsed = time.monotonic() - start
+            if self.max_wait != None and elapsed >= self.max_wait:
+                raise ValueError("polling timed out after " + str(int(elapsed)) + "s")
+            sleep = interval * (1 + random.uniform(-self.jitter, self.jitter))
+            if self.max_wait != None:
+                sleep = min(sleep, self.max_wait - elapsed)
+            time.sleep(sleep)
+            interval = min(interval * self.factor, self.max_interval)
@@ -3,21 +3,71 @@
 # Copyright: Gunter Fritz
 # Lizenz: Apache v 2.0
 
-import requests
-import sys
 import time
+#start of the imports (startup timing, see main)
+STARTED = time.perf_counter()
+
+import os
+import sys
 import csv
 import re
 import getopt
-
-from auth import Auth
-
-
-class Salesforce():
-    def __init__(self, access_token, instance_url):
-        self.timeout = 25.000
-        self.access_token = access_token
-        self.instance_url = instance_url
+import json
+import logging
+import shutil
+import hashlib
+import tempfile
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import Auth, Authorized, tokenKey
+from tokencache import TokenCache
+from pipeline import Prefetcher, PipelineStats
+from session import configure
+from polling import Backoff
+from fanout import fanOut, MAX_CONCURRENCY
+from scheduler import Scheduler
+from transform import Projection
+from sink import CsvSink
+from cache import Cache
+from journal import Journal, journalPath
+from instrument import Recorder, Profiler
+from metadata import Metadata
+
+
+logger = logging.getLogger(__name__)
+
+
+class Salesforce(Authorized):
+    def __init__(self, access_token, instance_url, session = None, auth = None):
+        Authorized.__init__(self, access_token, instance_url, session, auth)
+        #number of query pages fetched in advance (0: no background fetching)
+        self.prefetch = 0
+        self.stats = PipelineStats()
+        #max ids per sObject Collections request
+        self.collection_size = 200
+        #number of ids from which the Bulk API is used
+        self.bulk_threshold = 2000
+        #max records per Bulk batch
+        self.bulk_batch_size = 10000
+        #duplicate groups per chunk of createDuplicatesFromFile
+        self.duplicate_chunk_size = 2000
+        #max length of a query url (ids are checked in chunks that fit into it)
+        self.max_url = 16000
+        self.idexp = re.compile('^[a-zA-Z0-9]{15}([a-zA-Z0-9]{3})?$')
+        #max number of concurrent requests for per record operations
+        self.concurrency = 1
+        #cache of query results and existing records
+        self.cache = Cache()
+        #checkpoints of long running operations (see journal.Journal)
+        self.journal = Journal()
+        #polling strategy and progress callback for Bulk jobs
+        self.polling = Backoff()
+        self.progress = None
+        #if set, the transform of the pages is profiled (instrument.Profiler)
+        self.profiler = None
+        #describe metadata (cached), validates and expands field lists
+        self.metadata = Metadata(self)
 
 
     """
@@ -26,54 +76,81 @@ class Salesforce():
 
     params
     ------
-    purl: String, /services/data/v20.0/query?q=SELECT+name,BillingPostalCode+from+Account
+    purl:    String, /services/data/v20.0/query?q=SELECT+name,BillingPostalCode+from+Account
+    options: dict, additional headers (e.g. Sforce-Query-Options)
 
     return
     ------
     response
     """
-    def getUrl(self, purl):
+    def getUrl(self, purl, options = None):
         headers = { 'Authorization' : 'Bearer ' + self.access_token , 'X-PrettyPrint' : '1' }
+        if options != None:
+            headers.update(options)
         url = self.instance_url + purl
-        r = requests.get(url, headers = headers, timeout=self.timeout)
+        r = self.send('GET', url, headers, timeout=self.timeout)
 
         #print (r.json())
 
         return r
 
+    """
+    reads the API limits of the org (/limits resource) and passes the
+    daily API usage to the scheduler of the session
+
+    return
+    ------
+    json dict with all limits
+    """
+    def limits(self):
+        r = self.getUrl('/services/data/v42.0/limits/')
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+        limits = r.json()
+        daily = limits['DailyApiRequests']
+        self.session.scheduler.setUsage(daily['Max'] - daily['Remaining'], daily['Max'])
+        return limits
+
     """
     creates a duplicate group
         - needed DuplicateRule, DuplicateRecordSet, DuplicateRecordItem (for each data)
-    
+    the set and its items are created with one sObject Tree request
+
     params
     ------
     dubs: [] list of ids
 
     return
     ------
+    id of the DuplicateRecordSet, None if an id does not exist or the group could not be created
     """
     def deduplicate(self, dubs):
-        if self.exists("Account", dubs) == False:
-            return None
+        return self.deduplicateGroups([dubs])[0]
 
-        rule_id = self.getRuleId('Test_Regel')
-        
-        #create the group
-        headers = { 'Authorization' : 'Bearer ' + self.access_token , 'Content-Type' : 'application/json' }
-        url = self.instance_url + '/services/data/v42.0/sobjects/DuplicateRecordSet/'
-        p = { 'DuplicateRuleId' : rule_id }
-        r = requests.post(url, headers = headers, json=p, timeout=self.timeout)
-        print (r.json())
-        group_id = r.json()['id']
-       
-        #create DublicateItems
-        for dub in dubs:
-            url = self.instance_url + '/services/data/v42.0/sobjects/DuplicateRecordItem/'
-            p = { 'DuplicateRecordSetId' : group_id, 'RecordId' : dub }
-            r = requests.post(url, headers = headers, json=p, timeout=self.timeout)
-            print (r.json())
-        
-        return None
+    """
+    creates duplicate groups, many groups are created with each sObject Tree
+    request (see insertDuplicateTrees), groups with an id that does not exist
+    are skipped
+
+    params
+    ------
+    groups: [], list of duplicates (each element is a list of Record IDs)
+
+    return
+    ------
+    list of DuplicateRecordSet ids in order of groups (None if a group was skipped or could not be created)
+    """
+    def deduplicateGroups(self, groups):
+        missing = self.missing("Account", [i for g in groups for i in g])
+        valid = [k for k, g in enumerate(groups) if len([i for i in g if i in missing]) == 0]
+        set_ids, created = self.insertDuplicateTrees([groups[k] for k in valid])
+        logger.info("Created %d DuplicateRecordItems in %d groups", created,
+                len([i for i in set_ids if i != None]))
+
+        retval = [None] * len(groups)
+        for k, set_id in zip(valid, set_ids):
+            retval[k] = set_id
+        return retval
 
     """
     delete all DuplicateRecordSets from given DuplicateRule
@@ -87,45 +164,155 @@ class Salesforce():
     number of deleted objects
     """
     def clean(self, rule):
-        retval = 0
         rule_id = self.getRuleId(rule)
-        r = self.getUrl("/services/data/v42.0/query?q=SELECT+id+from+DuplicateRecordSet+WHERE+DuplicateRuleId+=+'" + rule_id+ "'")
-        
-        json = r.json()
-        if json['totalSize'] > 0:
-            #return existing ID
-            for r in json['records']:
-                retval = retval + self.delete('DuplicateRecordSet', r['Id'])
+        ids = (r['Id'] for page in self.queryPages("/services/data/v42.0/query?q=SELECT+id+from+DuplicateRecordSet+WHERE+DuplicateRuleId+=+'" + rule_id + "'")
+                for r in page['records'])
 
-        return retval
+        return self.deleteStream('DuplicateRecordSet', ids)
 
 
     """
     delete list of objects
+    up to self.collection_size ids are deleted with one request (sObject Collections),
+    lists with self.bulk_threshold or more ids are deleted with the Bulk API
 
     params
     ------
     sf_type: String, Salesforce sobject 
-    fields:  String, comma separated field names
+    ids:     String, comma separated ids or list of ids
 
     return
     ------
     number of deleted objects
     """
     def delete(self, sf_type, ids):
+        if isinstance(ids, str):
+            ids = ids.split(',')
+        #the journal entry is keyed by the ids, a resumed run skips deleted chunks
+        op = 'delete:' + sf_type + ':' + hashlib.sha1(','.join(ids).encode('utf-8')).hexdigest()
+        deleted = self.journal.get(op, 'deleted')
+        if deleted != None:
+            logger.info("Skipped %d ids, deleted before", len(ids))
+            return deleted
+        if len(ids) >= self.bulk_threshold:
+            results = self.deleteBulk(sf_type, ids, (op, 'job'))
+        else:
+            results = self.deleteCollections(ids)
+        self.cache.invalidate(sf_type, [i for i, success, message in results if success])
+
         deleted = 0
-        headers = { 'Authorization' : 'Bearer ' + self.access_token}
-        for i in ids.split(','):
-            url = self.instance_url + '/services/data/v42.0/sobjects/' + sf_type + '/' + i
-            r = requests.delete(url, headers = headers, timeout=self.timeout)
-            if r.status_code != 204:
-                print("Error deleting '" + sf_type + "##" + i + "': " + r.json()[0]['message'])
+        for i, success, message in results:
+            if not success:
+                logger.error("Error deleting '" + sf_type + "##" + i + "': " + message)
             else:
-                print("Deleted: '" + sf_type + "##" + i + "'")
+                logger.info("Deleted: '" + sf_type + "##" + i + "'")
                 deleted = deleted + 1
+        self.journal.put(op, 'deleted', deleted)
                 
         return deleted
 
+    """
+    deletes objects from a stream of ids, the ids are deleted in chunks of
+    self.bulk_threshold, so only one chunk is kept in memory
+
+    params
+    ------
+    sf_type: String, Salesforce sobject 
+    ids:     iterable of ids
+
+    return
+    ------
+    number of deleted objects
+    """
+    def deleteStream(self, sf_type, ids):
+        deleted = 0
+        chunk = []
+        for i in ids:
+            chunk.append(i)
+            if len(chunk) >= self.bulk_threshold:
+                deleted = deleted + self.delete(sf_type, chunk)
+                chunk = []
+        if len(chunk) > 0:
+            deleted = deleted + self.delete(sf_type, chunk)
+
+        return deleted
+
+    """
+    deletes objects with the sObject Collections API, one request per
+    self.collection_size ids (max 200), errors do not roll back other ids
+    up to self.concurrency requests are sent at the same time
+
+    params
+    ------
+    ids: [], list of ids (objects of different types are possible)
+
+    return
+    ------
+    list of (id, success, error message) in order of ids
+    """
+    def deleteCollections(self, ids):
+        chunks = [ids[start:start + self.collection_size] for start in range(0, len(ids), self.collection_size)]
+        results = []
+        for chunk, (res, error) in zip(chunks, fanOut(self.deleteChunk, chunks, self.concurrency)):
+            if error != None:
+                results.extend([(i, False, str(error)) for i in chunk])
+            else:
+                results.extend(res)
+
+        return results
+
+    """
+    helper, deletes up to 200 ids with one sObject Collections request
+
+    params
+    ------
+    chunk: [], list of ids
+
+    return
+    ------
+    list of (id, success, error message) in order of ids
+    """
+    def deleteChunk(self, chunk):
+        headers = { 'Authorization' : 'Bearer ' + self.access_token}
+        url = self.instance_url + '/services/data/v42.0/composite/sobjects?allOrNone=false&ids=' + ','.join(chunk)
+        r = self.send('DELETE', url, headers, timeout=self.timeout)
+        if r.status_code >= 400:
+            #the whole request failed
+            message = r.json()[0]['message']
+            return [(i, False, message) for i in chunk]
+        results = []
+        for i, res in zip(chunk, r.json()):
+            results.append((i, res['success'], self.errorMessage(res)))
+        return results
+
+    """
+    deletes objects with the Bulk API
+
+    params
+    ------
+    sf_type: String, Salesforce sobject 
+    ids:     [], list of ids
+    step:    (operation, key) of the journal entry of the job, None for no checkpoint
+
+    return
+    ------
+    list of (id, success, error message) in order of ids
+    """
+    def deleteBulk(self, sf_type, ids, step = None):
+        results = []
+        res = self.bulk('delete', sf_type, [{ 'Id' : i } for i in ids], step)
+        for i, r in zip(ids, res):
+            results.append((i, r['success'], self.errorMessage(r)))
+
+        return results
+
+    """
+    helper, returns the joined error messages from a result of the
+    collections or Bulk API
+    """
+    def errorMessage(self, result):
+        return ", ".join([e['message'] for e in result.get('errors', [])])
+
 
     """
     returns the database id from a rule. If no such rule exists it is created
@@ -140,13 +327,12 @@ class Salesforce():
     """
     def getRuleId(self, rule, label = None):
         #read specific DuplicateRules 
-        r = self.getUrl("/services/data/v42.0/query?q=SELECT+id,MasterLabel,DeveloperName+from+DuplicateRule+WHERE+DeveloperName+=+'" + rule + "'")
+        records = self.cachedQuery("/services/data/v42.0/query?q=SELECT+id,MasterLabel,DeveloperName+from+DuplicateRule+WHERE+DeveloperName+=+'" + rule + "'", 'DuplicateRule')
 
-        json = r.json()
-        if json['totalSize'] > 0:
+        if len(records) > 0:
             #return existing ID
-            for r in json['records']:
-                print("Rule " + rule + " exists" )
+            for r in records:
+                logger.debug("Rule " + rule + " exists")
                 return str(r['Id'])
 
         if label == None:
@@ -154,17 +340,264 @@ class Salesforce():
             return None
         #DOES NOT WORK!!!
         #create Rule
-        print("Creating rule: " + rule)
+        logger.info("Creating rule: " + rule)
         headers = { 'Authorization' : 'Bearer ' + self.access_token , 'Content-Type' : 'application/json' }
         url = self.instance_url + '/services/data/v37.0/sobjects/DuplicateRule/'
         p = { 'DeveloperName' : rule }
         #p = { 'DeveloperName' : rule, 'MasterLabel' : label, 'SobjectType' : 'Account', 'IsActive' : True }
-        r = requests.post(url, headers = headers, json=p, timeout=self.timeout)
-        print(r.json()) 
+        r = self.send('POST', url, headers, json=p, timeout=self.timeout)
+        self.cache.invalidate('DuplicateRule')
+        logger.debug("created DuplicateRule %s", r.json())
         return str(r.json()['id'])
 
     """
-    list fields from object sf_type
+    returns the records of a query, the result is taken from self.cache
+    if possible (for small results, all pages are kept)
+
+    params
+    ------
+    purl:    String, query url
+    sf_type: String, queried sobject (invalidates the result if changed)
+
+    return
+    ------
+    list of records
+    """
+    def cachedQuery(self, purl, sf_type):
+        records = self.cache.getQuery(purl)
+        if records == None:
+            records = [r for page in self.fetchPages(purl) for r in page['records']]
+            self.cache.putQuery(purl, sf_type, records)
+        return records
+
+    """
+    generator over the result pages of a query, follows nextRecordsUrl
+
+    params
+    ------
+    purl:      String, query url e.g. /services/data/v42.0/query?q=SELECT+Id+from+Account
+    page_size: int, max records per page (200 - 2000), None for the default of Salesforce
+
+    return
+    ------
+    generator, json dict of each page
+    """
+    def fetchPages(self, purl, page_size = None):
+        options = None if page_size == None else { 'Sforce-Query-Options' : 'batchSize=' + str(page_size) }
+        r = self.getUrl(purl, options)
+        while True:
+            json = r.json()
+            yield json
+            if 'nextRecordsUrl' not in json:
+                break
+            r = self.getUrl(json['nextRecordsUrl'], options)
+
+    """
+    iterator over the result pages of a query
+    if self.prefetch > 0 the next pages are fetched in a background thread while
+    the current page is processed, at most self.prefetch pages are buffered
+    timings are collected in self.stats
+
+    params
+    ------
+    purl:      String, query url e.g. /services/data/v42.0/query?q=SELECT+Id+from+Account
+    page_size: int, max records per page (200 - 2000), None for the default of Salesforce
+
+    return
+    ------
+    iterator, json dict of each page
+    """
+    def queryPages(self, purl, page_size = None):
+        return iter(Prefetcher(self.fetchPages(purl, page_size), self.prefetch, self.stats))
+
+    """
+    helper, transforms the records of a page (profiled with self.profiler)
+
+    params
+    ------
+    projection: transform.Projection or function with the records as argument
+    records:    [], list of records (json dicts)
+
+    return
+    ------
+    result of the transform (e.g. list of lines)
+    """
+    def transform(self, projection, records):
+        func = projection.apply if isinstance(projection, Projection) else projection
+        if self.profiler == None:
+            return func(records)
+        return self.profiler.call(func, records)
+
+    """
+    streams fields from object sf_type, page by page as they arrive
+    memory usage is constant (one page), regardless of the object size
+    the fields are validated (self.metadata) when the generator is created
+
+    params
+    ------
+    sf_type:  String, Salesforce sobject 
+    fields:   String, comma separated field names if field name is "-" its an empty field,
+              "*" for all fields, relationship paths like Owner.Name
+    sanitize: bool, replace all non alphanumeric characters by ' ' (see transform.Projection)
+
+    return
+    ------
+    generator, first line is header (list), each following line is a tuple of field values
+    """
+    def iterObjects(self, sf_type, fields, sanitize = True):
+        fields = self.metadata.compile(sf_type, fields)
+        projection = Projection(fields.fields, sanitize)
+
+        def lines():
+            yield projection.header
+            for json in self.queryPages('/services/data/v42.0/query?q=SELECT+' + ",".join(projection.fields) + '+from+' + sf_type, fields.page_size):
+                yield from self.transform(projection, json['records'])
+
+        return lines()
+
+    """
+    returns the lowest and the highest id of an sobject
+
+    params
+    ------
+    sf_type: String, Salesforce sobject 
+
+    return
+    ------
+    lowest id, highest id (None, None if there are no records)
+    """
+    def idRange(self, sf_type):
+        purl = '/services/data/v42.0/query?q=SELECT+Id+FROM+' + sf_type + '+ORDER+BY+Id+'
+        low = self.getUrl(purl + 'ASC+LIMIT+1').json()['records']
+        high = self.getUrl(purl + 'DESC+LIMIT+1').json()['records']
+        if len(low) == 0 or len(high) == 0:
+            return None, None
+        return low[0]['Id'], high[0]['Id']
+
+    """
+    exports fields from object sf_type in csv format, the object is split into
+    Id ranges (see partition.py), which are queried at the same time
+
+    if out contains {part}, each range is written to its own file ({part} is
+    replaced by the number of the range, each file has a header). Otherwise the
+    ranges are written to temporary files (next to out), which are appended to
+    out (or stdout) in order of the ranges
+
+    params
+    ------
+    sf_type:    String, Salesforce sobject 
+    fields:     String, comma separated field names if field name is "-" its an empty field
+    partitions: int, number of Id ranges (max MAX_CONCURRENCY are queried at the same time)
+    out:        String, output file, None for stdout
+    compress:   String, None, 'gzip' or 'zstd'
+    sanitize:   bool, replace all non alphanumeric characters by ' '
+
+    return
+    ------
+    number of exported records
+    """
+    def exportPartitioned(self, sf_type, fields, partitions, out = None, compress = None, sanitize = True):
+        fields = self.metadata.compile(sf_type, fields)
+        projection = Projection(fields.fields, sanitize)
+        select = '/services/data/v42.0/query?q=SELECT+' + ",".join(projection.fields) + '+from+' + sf_type
+        low, high = self.idRange(sf_type)
+        from partition import idBounds, idConditions
+        conditions = idConditions([] if low == None else idBounds(low, high, partitions))
+
+        per_file = out != None and '{part}' in out
+        if per_file:
+            paths = [out.replace('{part}', str(n)) for n in range(len(conditions))]
+        else:
+            directory = None if out == None else os.path.dirname(os.path.abspath(out))
+            paths = []
+            for n in range(len(conditions)):
+                fd, path = tempfile.mkstemp(suffix = '.csv', dir = directory)
+                os.close(fd)
+                paths.append(path)
+
+        def export(n):
+            purl = select if conditions[n] == '' else select + '+WHERE+' + conditions[n].replace(' ', '+')
+            with CsvSink(paths[n], compress = compress) as sink:
+                if per_file or n == 0:
+                    sink.write([projection.header])
+                count = 0
+                for page in self.queryPages(purl, fields.page_size):
+                    count = count + sink.write(self.transform(projection, page['records']))
+                return count
+
+        try:
+            results = fanOut(export, list(range(len(conditions))), len(conditions))
+            for res, error in results:
+                if error != None:
+                    raise error
+            if not per_file:
+                #compressed parts are complete gzip members / zstd frames, they can be concatenated
+                sys.stdout.flush()
+                target = sys.stdout.buffer if out == None else open(out, 'wb')
+                try:
+                    for path in paths:
+                        with open(path, 'rb') as f:
+                            shutil.copyfileobj(f, target, 1024 * 1024)
+                finally:
+                    if out == None:
+                        target.flush()
+                    else:
+                        target.close()
+        finally:
+            if not per_file:
+                for path in paths:
+                    os.remove(path)
+
+        return sum([res for res, error in results])
+
+    """
+    returns the describe metadata of an sobject (fields with their types, ...)
+
+    params
+    ------
+    sf_type: String, Salesforce sobject 
+
+    return
+    ------
+    json dict
+    """
+    def describe(self, sf_type):
+        r = self.getUrl('/services/data/v42.0/sobjects/' + sf_type + '/describe/')
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+        return r.json()
+
+    """
+    exports fields from object sf_type to a Parquet or Arrow IPC file, the
+    columns are typed by the describe metadata, pages are written in row groups
+    as they arrive (needs the package pyarrow)
+
+    params
+    ------
+    sf_type: String, Salesforce sobject 
+    fields:  String, comma separated field names ("-" fields are ignored), "*" for all
+             fields, relationship paths like Owner.Name
+    path:    String, output file
+    format:  String, 'parquet' or 'arrow'
+
+    return
+    ------
+    number of exported records
+    """
+    def exportColumnar(self, sf_type, fields, path, format = 'parquet'):
+        fields = self.metadata.compile(sf_type, fields)
+        getfields = fields.query
+
+        #pyarrow is only loaded for --format
+        from columnar import ColumnarSink
+        with ColumnarSink(path, getfields, [fields.types[f] for f in getfields], format) as sink:
+            for page in self.queryPages('/services/data/v42.0/query?q=SELECT+' + ",".join(getfields) + '+from+' + sf_type, fields.page_size):
+                self.transform(sink.write, page['records'])
+            return sink.count
+
+    """
+    list fields from object sf_type, the complete result is kept in memory
+    for large objects use iterObjects
 
     params
     ------
@@ -176,38 +609,36 @@ class Salesforce():
     list of objects, first line is header
     """
     def listObjects(self, sf_type, fields):
-        getfields = fields.replace(",-,", ",").replace("-,", "").replace(",-", "")
-        r = self.getUrl('/services/data/v42.0/query?q=SELECT+' + getfields + '+from+' + sf_type)
-        #print(r.json())
-        header = fields.split(",")
-        retval = [header]
-        regexp = re.compile('[^a-zA-Z0-9@ßäüö]')
-        while True:
-            json = r.json()
-            for r in json['records']:
-                line = []
-                for f in header:
-                    if f == "-":
-                        line.append('')
-                        continue
-                    #TODO:replace all non alphanumeric chars
-                    line.append(regexp.sub(' ', str(r[f])))
-                retval.append(line)
-            if 'nextRecordsUrl' in json:
-                print("read")
-                r = self.getUrl(json['nextRecordsUrl'])
-                print("ready")
-            else:
-                break
-        
-        return retval
+        return list(self.iterObjects(sf_type, fields))
+
+    """
+    prints lines to stdout, each line is written as soon as it is read
 
+    params
+    ------
+    out:       iterable of lines (list of Strings)
+    delimiter: String, field separator
+    """
     def printCsv(self, out, delimiter):
-        for line in out:
-            output = line[0]
-            for f in line[1:]:
-                output = output + delimiter + f
-            print(output)
+        self.writeCsv(out, delimiter = delimiter)
+
+    """
+    writes lines in csv format (buffered, values are quoted if needed)
+
+    params
+    ------
+    out:       iterable of lines (list of Strings)
+    path:      String, output file, None for stdout
+    compress:  String, None, 'gzip' or 'zstd'
+    delimiter: String, field separator
+
+    return
+    ------
+    number of lines written
+    """
+    def writeCsv(self, out, path = None, compress = None, delimiter = ";"):
+        with CsvSink(path, delimiter, compress) as sink:
+            return sink.write(out)
 
     """
     delete all objects sf_type
@@ -215,37 +646,83 @@ class Salesforce():
     params
     ------
     sf_type: String, Salesforce sobject 
-    fields:  String, comma separated field names
 
     return
     ------
-    list of objects, first line is header
+    number of deleted objects
     """
     def deleteAll(self, sf_type):
-        for ids in self.listObjects(sf_type, 'Id,Name'):
-            print("deleting:", ids[1])
-            self.delete(sf_type, ids[0])
+        lines = self.iterObjects(sf_type, 'Id,Name')
+        #skip header
+        next(lines)
+
+        def ids():
+            for line in lines:
+                logger.debug("deleting: %s", line[1])
+                yield line[0]
+
+        return self.deleteStream(sf_type, ids())
 
     """
     wrapper to list all accounts with fiew standard fields in csv format to stdout
     first line is header
+
+    params
+    ------
+    out:      String, output file, None for stdout
+    compress: String, None, 'gzip' or 'zstd'
+    sanitize: bool, replace all non alphanumeric characters by ' '
     """
-    def listAccounts(self):
-        accounts = self.listObjects('Account', 'Id,BillingCountry,-,Name,-,BillingStreet,-,BillingPostalCode,BillingCity,-')
-        self.printCsv(accounts, ";")
+    def listAccounts(self, out = None, compress = None, sanitize = True):
+        self.listObjectsCsv('Account', 'Id,BillingCountry,-,Name,-,BillingStreet,-,BillingPostalCode,BillingCity,-', out, compress, sanitize)
 
     """
     wrapper to list all accounts with fiew standard fields in csv format to stdout
     first line is header
+    an uncompressed output file is checkpointed after each page (size of the
+    file and nextRecordsUrl in self.journal), a resumed run cuts the file to
+    the checkpoint and continues the query with nextRecordsUrl
     
     params
     ------
-    sf_type: String, Salesforce sobject 
-    fields:  String, comma separated field names
+    sf_type:  String, Salesforce sobject 
+    fields:   String, comma separated field names
+    out:      String, output file, None for stdout
+    compress: String, None, 'gzip' or 'zstd'
+    sanitize: bool, replace all non alphanumeric characters by ' '
+
+    return
+    ------
+    number of exported records
     """
-    def listObjectsCsv(self, obj, fields):
-        accounts = self.listObjects(obj, fields)
-        self.printCsv(accounts, ";")
+    def listObjectsCsv(self, obj, fields, out = None, compress = None, sanitize = True):
+        if out == None or compress != None:
+            accounts = self.iterObjects(obj, fields, sanitize)
+            return self.writeCsv(accounts, out, compress) - 1
+
+        op = 'list:' + obj + ':' + os.path.abspath(out)
+        fields = self.metadata.compile(obj, fields)
+        projection = Projection(fields.fields, sanitize)
+        purl = '/services/data/v42.0/query?q=SELECT+' + ",".join(projection.fields) + '+from+' + obj
+        checkpoint = self.journal.get(op, 'page')
+        if checkpoint != None:
+            if checkpoint['url'] == None:
+                logger.info("Skipped %s, written before to %s", obj, out)
+                return checkpoint['lines']
+            logger.info("Resuming %s after %d lines", obj, checkpoint['lines'])
+            with open(out, 'r+b') as f:
+                f.truncate(checkpoint['size'])
+            purl = checkpoint['url']
+
+        with CsvSink(out, append = checkpoint != None) as sink:
+            lines = 0 if checkpoint == None else checkpoint['lines']
+            if checkpoint == None:
+                sink.write([projection.header])
+            for page in self.queryPages(purl, fields.page_size):
+                lines = lines + sink.write(self.transform(projection, page['records']))
+                size = sink.flush()
+                self.journal.put(op, 'page', { 'url' : page.get('nextRecordsUrl'), 'size' : size, 'lines' : lines })
+        return lines
 
     """
     reads an outputfile from identity and exports each group to identiyt
@@ -253,42 +730,113 @@ class Salesforce():
         out_grp_id: group id from identity
         1         : salesforce Account id
 
+    the file is read incrementally, the groups are created in chunks of
+    self.duplicate_chunk_size groups: while the DuplicateRecordItems of a chunk
+    are inserted, the DuplicateRecordSets of the next chunk are created
+    chunks of less than self.bulk_threshold records (sets and items) are created
+    with sObject Tree requests instead of two Bulk jobs (see insertDuplicateTrees)
+    created sets and finished chunks are written to self.journal, a resumed
+    run skips finished chunks and reuses created sets
+
+    params
+    ------
+    filename: String, inputfile
+    num:      int, max number of groups to be created, None for all groups
+
+    return
+    ------
+    number of created DuplicateRecordItems
+    """
+    def createDuplicatesFromFile(self, filename, num = None):
+        op = 'filededup:' + os.path.abspath(filename) + ':' + str(self.duplicate_chunk_size) + ':' + str(num)
+
+        def insertItems(n, set_ids, dups):
+            count = self.insertDuplicateItems(set_ids, dups, (op, 'itemjob:%d' % n))
+            self.journal.put(op, 'items:%d' % n, count)
+            return count
+
+        start = time.perf_counter()
+        groups = 0
+        created = 0
+        with ThreadPoolExecutor(max_workers = 1) as executor:
+            pending = None
+            for n, dups in enumerate(self.chunks(self.duplicateGroups(filename, num), self.duplicate_chunk_size)):
+                groups = groups + len(dups)
+                count = self.journal.get(op, 'items:%d' % n)
+                if count != None:
+                    #finished by an interrupted run
+                    created = created + count
+                    continue
+                set_ids = self.journal.get(op, 'sets:%d' % n)
+                if set_ids == None and len(dups) + sum([len(d) for d in dups]) < self.bulk_threshold:
+                    set_ids, count = self.insertDuplicateTrees(dups, (op, 'trees:%d' % n))
+                    self.journal.put(op, 'items:%d' % n, count)
+                    created = created + count
+                    continue
+                if set_ids == None:
+                    set_ids = self.createDuplicateRecordSet(len(dups), (op, 'setjob:%d' % n))
+                    self.journal.put(op, 'sets:%d' % n, set_ids)
+                if pending != None:
+                    created = created + pending.result()
+                pending = executor.submit(insertItems, n, set_ids, dups)
+            if pending != None:
+                created = created + pending.result()
+
+        elapsed = time.perf_counter() - start
+        logger.info("Created %d DuplicateRecordItems in %d groups in %.1fs (%.0f groups/s)",
+                created, groups, elapsed, groups / elapsed if elapsed > 0 else 0)
+        return created
+
+    """
+    reads the groups of an outputfile from identity (see createDuplicatesFromFile),
+    the rows of a group are consecutive
+
     params
     ------
     filename: String, inputfile
-    num:      int, max number of groups to be created
+    num:      int, max number of groups, None for all groups
+
+    return
+    ------
+    generator, each element is a list of Record ids (groups with one id are skipped)
     """
-    def createDuplicatesFromFile(self, filename, num):
-        grp_id = -1
-        count = -1
+    def duplicateGroups(self, filename, num = None):
+        if num != None and num < 1:
+            return
+        count = 0
+        grp_id = None
         idlist = []
-        dups = []
         with open(filename, "r") as csvfile:
             reader = csv.DictReader(csvfile, delimiter = ";")
             for row in reader:
-                if row['out_grp_id'] != grp_id:
-                    if len(idlist)>1:
-                        #close group
-                        #self.deduplicate(idlist)
-                        dups.append(idlist)
-                    count = count + 1
-                    if count == num:
-                        break
-                    idlist = [row['1']]
-                    grp_id = row['out_grp_id']
-                    
-                else:
+                if row['out_grp_id'] == grp_id:
                     #add data id to group
                     idlist.append(row['1'])
-            if count < num:
-                #close last group
-                count = count + 1
-                dups.append(idlist)
-                #self.deduplicate(idlist)
-        self.insertDuplicates(dups)
-
+                    continue
+                if len(idlist) > 1:
+                    #close group
+                    yield idlist
+                    count = count + 1
+                    if count == num:
+                        return
+                idlist = [row['1']]
+                grp_id = row['out_grp_id']
+        if len(idlist) > 1 and count != num:
+            #close last group
+            yield idlist
 
-   
+    """
+    helper, splits an iterable into lists of size elements (the last may be shorter)
+    """
+    def chunks(self, items, size):
+        chunk = []
+        for i in items:
+            chunk.append(i)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
 
     """
     helper to create json, to create num DuplicateRecordSets
@@ -319,12 +867,13 @@ class Salesforce():
     """
     def createDuplicateRecordItemJson(self, set_ids, dups):
         if len(dups) != len(set_ids):
-            raise ValueError("length of record sets (" + len(dups) + 
-                    ") doesn't match length of recordsetid (" + len(set_ids) + ")")
+            raise ValueError("length of record sets (" + str(len(dups)) + 
+                    ") doesn't match length of recordsetid (" + str(len(set_ids)) + ")")
         data= []
         for group_id, recs in zip(set_ids, dups):
+            if group_id == None:
+                continue
             for rec in recs:
-                print({ 'DuplicateRecordSetId' : group_id, 'RecordId' : rec})
                 data.append({ 'DuplicateRecordSetId' : group_id, 'RecordId' : rec})
 
         return data
@@ -334,20 +883,195 @@ class Salesforce():
 
     params
     ------
-    num, int number or DuplicateRecordSet to be created
+    num,  int number or DuplicateRecordSet to be created
+    step, (operation, key) of the journal entry of the job, None for no checkpoint
 
     return
     ------
-    list of DublicateRecordSet Ids
+    list of DublicateRecordSet Ids (None if a set could not be created)
     """
-    def createDuplicateRecordSet(self, num):
+    def createDuplicateRecordSet(self, num, step = None):
         json = self.createDuplicateRecordSetJson(num)
-        res = self.insertBulk("DuplicateRecordSet", json).json()
+        res = self.insertBulk("DuplicateRecordSet", json, step)
         retval = []
         for i in res:
+            if not i['success']:
+                logger.error("Error creating DuplicateRecordSet: " + self.errorMessage(i))
             retval.append(i['id'])
         return retval
 
+    """
+    creates a DuplicateRecordSet with its DuplicateRecordItems for each group
+    with the sObject Tree API (composite/tree), without the latency of a Bulk
+    job: the groups are packed into requests of up to self.collection_size
+    records (sets and items), up to self.concurrency requests are sent at the
+    same time. Items of a group that do not fit into one request are attached
+    with sObject Collections
+
+    params
+    ------
+    dups: [], list of duplicates (each element is a list of Record IDs)
+    step: (operation, key) of the journal, the set ids of request n are written
+          to key:n, so a resumed run does not create them again, None for no checkpoint
+
+    return
+    ------
+    (list of DuplicateRecordSet ids in order of dups (None if a set could not be created),
+     number of created DuplicateRecordItems)
+    """
+    def insertDuplicateTrees(self, dups, step = None):
+        if len(dups) == 0:
+            return [], 0
+        rule_id = self.getRuleId('Test_Regel')
+        #items per set in the tree, one record is the set
+        per_set = self.collection_size - 1
+        trees = self.treeChunks(dups)
+
+        def insert(n):
+            if step != None:
+                set_ids = self.journal.get(step[0], step[1] + ':%d' % n)
+                if set_ids != None:
+                    return set_ids
+            set_ids = self.insertTree(rule_id, [dups[k][:per_set] for k in trees[n]])
+            if step != None:
+                self.journal.put(step[0], step[1] + ':%d' % n, set_ids)
+            return set_ids
+
+        retval = [None] * len(dups)
+        created = 0
+        overflow = []
+        for tree, (set_ids, error) in zip(trees, fanOut(insert, list(range(len(trees))), self.concurrency)):
+            if error != None:
+                logger.error("Error creating DuplicateRecordSets: %s", error)
+                continue
+            for k, set_id in zip(tree, set_ids):
+                retval[k] = set_id
+                if set_id != None:
+                    created = created + min(len(dups[k]), per_set)
+                    overflow.extend([{ 'DuplicateRecordSetId' : set_id, 'RecordId' : i } for i in dups[k][per_set:]])
+        self.cache.invalidate('DuplicateRecordSet')
+        self.cache.invalidate('DuplicateRecordItem')
+
+        if len(overflow) > 0:
+            count = None if step == None else self.journal.get(step[0], step[1] + ':overflow')
+            if count == None:
+                count = self.insertCollections('DuplicateRecordItem', overflow)
+                if step != None:
+                    self.journal.put(step[0], step[1] + ':overflow', count)
+            created = created + count
+
+        return retval, created
+
+    """
+    helper, packs duplicate groups into sObject Tree requests of up to
+    self.collection_size records (the set and up to self.collection_size - 1 items per group)
+
+    params
+    ------
+    dups: [], list of duplicates (each element is a list of Record IDs)
+
+    return
+    ------
+    list of requests, each is a list of indices of dups
+    """
+    def treeChunks(self, dups):
+        trees = []
+        size = self.collection_size
+        for k, dup in enumerate(dups):
+            records = 1 + min(len(dup), self.collection_size - 1)
+            if size + records > self.collection_size:
+                trees.append([])
+                size = 0
+            trees[-1].append(k)
+            size = size + records
+        return trees
+
+    """
+    helper, creates DuplicateRecordSets with their DuplicateRecordItems with one
+    sObject Tree request (all or none). If groups fail, they are logged and the
+    other groups are sent again
+
+    params
+    ------
+    rule_id: String, DuplicateRule of the sets
+    groups:  [], list of duplicates (each element is a list of Record IDs), max
+             self.collection_size records (sets and items) in total
+
+    return
+    ------
+    list of DuplicateRecordSet ids in order of groups (None if a set could not be created)
+    """
+    def insertTree(self, rule_id, groups):
+        records = []
+        for k, group in enumerate(groups):
+            items = [{ 'attributes' : { 'type' : 'DuplicateRecordItem', 'referenceId' : 's%di%d' % (k, j) }, 'RecordId' : i }
+                    for j, i in enumerate(group)]
+            records.append({ 'attributes' : { 'type' : 'DuplicateRecordSet', 'referenceId' : 's%d' % k },
+                    'DuplicateRuleId' : rule_id, 'DuplicateRecordItems' : { 'records' : items } })
+
+        headers = { 'Authorization' : 'Bearer ' + self.access_token , 'Content-Type' : 'application/json' }
+        url = self.instance_url + '/services/data/v42.0/composite/tree/DuplicateRecordSet/'
+        r = self.send('POST', url, headers, json={ 'records' : records }, timeout=self.timeout)
+        result = r.json()
+        if not isinstance(result, dict):
+            #the whole request failed
+            raise ValueError(result[0]['message'])
+        if not result['hasErrors']:
+            ids = dict([(res['referenceId'], res['id']) for res in result['results']])
+            logger.debug("created %d DuplicateRecordSets", len(groups))
+            return [ids['s%d' % k] for k in range(len(groups))]
+
+        #nothing was created, the groups without errors are sent again
+        failed = set()
+        for res in result['results']:
+            k = int(re.match(r's(\d+)', res['referenceId']).group(1))
+            failed.add(k)
+            logger.error("Error creating duplicate group %s: %s", groups[k], self.errorMessage(res))
+        retry = [k for k in range(len(groups)) if k not in failed]
+        retval = [None] * len(groups)
+        if len(failed) > 0 and len(retry) > 0:
+            for k, set_id in zip(retry, self.insertTree(rule_id, [groups[k] for k in retry])):
+                retval[k] = set_id
+        return retval
+
+    """
+    creates records with sObject Collections, self.collection_size records per
+    request, errors do not roll back other records
+
+    params
+    ------
+    sf_type: String, Salesforce sobject
+    records: [], list of json dicts (fields of the records)
+
+    return
+    ------
+    number of created records
+    """
+    def insertCollections(self, sf_type, records):
+        headers = { 'Authorization' : 'Bearer ' + self.access_token , 'Content-Type' : 'application/json' }
+        url = self.instance_url + '/services/data/v42.0/composite/sobjects/'
+
+        def insert(chunk):
+            p = { 'allOrNone' : False, 'records' : [dict([('attributes', { 'type' : sf_type })] + list(rec.items())) for rec in chunk] }
+            r = self.send('POST', url, headers, json=p, timeout=self.timeout)
+            if r.status_code >= 400:
+                raise ValueError(r.json()[0]['message'])
+            return r.json()
+
+        created = 0
+        chunks = list(self.chunks(records, self.collection_size))
+        for chunk, (res, error) in zip(chunks, fanOut(insert, chunks, self.concurrency)):
+            if error != None:
+                logger.error("Error creating %d %s: %s", len(chunk), sf_type, error)
+                continue
+            for rec, r in zip(chunk, res):
+                if r['success']:
+                    created = created + 1
+                else:
+                    logger.error("Error creating " + sf_type + " " + str(rec) + ": " + self.errorMessage(r))
+        self.cache.invalidate(sf_type)
+        return created
+
     """
     creates DuplicateRecordSet and attach DuplicateRecordItem, uses Bulk API
 
@@ -357,17 +1081,40 @@ class Salesforce():
 
     return
     ------
-    response
+    number of created DuplicateRecordItems
     """
     def insertDuplicates(self, dups):
         set_ids = self.createDuplicateRecordSet(len(dups))
+        return self.insertDuplicateItems(set_ids, dups)
+
+    """
+    attaches DuplicateRecordItems to created DuplicateRecordSets, uses Bulk API
+
+    params
+    ------
+    set_ids: [], list of DuplicateRecordSet ids (None if a set could not be created)
+    dups:    [], list of duplicates (each element is a list of Record IDs)
+    step:    (operation, key) of the journal entry of the job, None for no checkpoint
+
+    return
+    ------
+    number of created DuplicateRecordItems
+    """
+    def insertDuplicateItems(self, set_ids, dups, step = None):
         json = self.createDuplicateRecordItemJson(set_ids, dups)
-        
-        result = self.insertBulk("DuplicateRecordItem", json)
+        if len(json) == 0:
+            return 0
 
-        print(result.text)
-        if result.status_code >= 400:
-            raise ValueError(r.text)
+        result = self.insertBulk("DuplicateRecordItem", json, step)
+
+        created = 0
+        for item, r in zip(json, result):
+            if r['success']:
+                created = created + 1
+            else:
+                logger.error("Error creating DuplicateRecordItem " + str(item) + ": " + self.errorMessage(r))
+        logger.info("Created %d of %d DuplicateRecordItems", created, len(json))
+        return created
 
     """
     wrapper to handle a complete batch (insert) job
@@ -376,13 +1123,115 @@ class Salesforce():
     ------
     sf_type, String Salesforce object to be created
     json,    corresponding json object
+    step,    (operation, key) of the journal entry of the job, None for no checkpoint
+
+    return
+    ------
+    list of results (json dicts), in order of the records
+    """
+    def insertBulk(self, sf_type, json, step = None):
+        return self.bulk('insert', sf_type, json, step)
+
+    """
+    wrapper to handle a complete batch job
+    with a step the job id and the added batches are written to self.journal,
+    a resumed run continues the journaled job: added batches are not sent again
+
+    params
+    ------
+    operation, String (insert, delete)
+    sf_type,   String Salesforce object
+    json,      corresponding json object
+    step,      (operation, key) of the journal entry of the job, None for no checkpoint
+
+    return
+    ------
+    list of results (json dicts), in order of the records
+    """
+    def bulk(self, operation, sf_type, json, step = None):
+        self.cache.invalidate(sf_type)
+        bulk = Bulk(self.access_token, self.instance_url, self.session, self.auth)
+        bulk.max_records = self.bulk_batch_size
+        bulk.polling = self.polling
+        bulk.progress = self.progress
+        job = None if step == None else self.journal.get(step[0], step[1])
+        if job == None:
+            bulk.createJob(operation, sf_type)
+            job = { 'id' : bulk.jobId, 'batches' : [], 'closed' : False }
+        else:
+            logger.info("Resuming job %s", job['id'])
+            bulk.jobId = job['id']
+            bulk.batchIds = list(job['batches'])
+
+        def checkpoint(batchId = None):
+            if batchId != None:
+                job['batches'].append(batchId)
+            if step != None:
+                self.journal.put(step[0], step[1], job)
+
+        checkpoint()
+        if not job['closed']:
+            bulk.added = checkpoint
+            bulk.addBatches(json, len(job['batches']))
+            bulk.close()
+            job['closed'] = True
+            checkpoint()
+        return bulk.getResults()
+
+    """
+    exports fields of all objects sf_type to a csv file with a Bulk API 2.0 query job
+
+    params
+    ------
+    sf_type:  String, Salesforce sobject 
+    fields:   String, comma separated field names ("-" fields are ignored)
+    filename: String, csv file
+
+    return
+    ------
+    number of exported records
+    """
+    def bulkExport(self, sf_type, fields, filename):
+        getfields = self.metadata.compile(sf_type, fields).query
+        from bulk2 import Bulk2
+        bulk = Bulk2(self.access_token, self.instance_url, self.session, self.auth)
+        bulk.polling = self.polling
+        bulk.progress = self.progress
+        return bulk.query("SELECT " + ",".join(getfields) + " FROM " + sf_type, filename)
+
+    """
+    loads a csv file with a Bulk API 2.0 ingest job, failed records are
+    written to <filename>.failed.csv
+
+    params
+    ------
+    operation:   String (insert, update, upsert, delete)
+    sf_type:     String, Salesforce sobject 
+    filename:    String, csv file, first line is header with field names
+    external_id: String, external id field, needed for upsert
+
+    return
+    ------
+    number of processed and failed records
     """
-    def insertBulk(self, sf_type, json):
-        bulk = Bulk(self.access_token, self.instance_url)
-        bulk.createJob('insert', sf_type)
-        bulk.jbatch(json)
-        bulk.close()
-        return bulk.getSuccessfulResult()
+    def bulkLoad(self, operation, sf_type, filename, external_id = None):
+        from bulk2 import Bulk2
+        self.cache.invalidate(sf_type)
+        bulk = Bulk2(self.access_token, self.instance_url, self.session, self.auth)
+        bulk.polling = self.polling
+        bulk.progress = self.progress
+        processed = 0
+        failed = 0
+        for info in bulk.ingest(operation, sf_type, filename, external_id):
+            processed = processed + info['numberRecordsProcessed']
+            failed = failed + info['numberRecordsFailed']
+            if info['numberRecordsFailed'] > 0:
+                #one file per job
+                name = filename + '.failed.csv' if failed == info['numberRecordsFailed'] else filename + '.' + info['id'] + '.failed.csv'
+                bulk.saveResults(info['id'], 'failedResults', name)
+                logger.warning("Failed records written to %s", name)
+
+        return processed, failed
 
     """
     checks if all requested ids objects are existing
@@ -398,22 +1247,89 @@ class Salesforce():
     False: one or more objects do not exist
     """
     def exists(self, sf_type, ids):
-        retval = True
+        return len(self.missing(sf_type, ids)) == 0
+
+    """
+    resolves which of the requested ids do not exist
+    the ids are checked with SELECT Id FROM <sf_type> WHERE Id IN (...) queries,
+    each query holds as many ids as fit into self.max_url, up to self.concurrency
+    queries are sent at the same time. Ids found before (self.cache) are not queried again
+
+    params
+    ------
+    sf_type: String, sobject type (e.g. Account)
+    ids:     String[], list of sf ids (15 or 18 characters)
+
+    return
+    ------
+    set of ids that do not exist (or are not valid ids)
+    """
+    def missing(self, sf_type, ids):
+        retval = set()
+        valid = []
         for i in ids:
-            r = self.getUrl('/services/data/v42.0/sobjects/' + sf_type + '/' + i)
-            if r.status_code != 200:
-                retval = False
-                print("Error:", r.json()[0]['message'])
+            if self.idexp.match(i):
+                valid.append(i)
             else:
-                print("Id ok:", i)
+                retval.add(i)
+
+        def query(purl):
+            return [r['Id'] for page in self.fetchPages(purl) for r in page['records']]
+
+        #ids found in this or a recent run
+        found = set(self.cache.getRecords(sf_type, valid))
+        unknown = [i for i in valid if i not in found]
+        chunks = list(self.idChunks("/services/data/v42.0/query?q=SELECT+Id+FROM+" + sf_type + "+WHERE+Id+IN+(", unknown))
+        for res, error in fanOut(query, chunks, self.concurrency):
+            if error != None:
+                raise error
+            records = {}
+            for i in res:
+                found.add(i)
+                found.add(i[:15])
+                records[i] = { 'Id' : i }
+                records[i[:15]] = { 'Id' : i }
+            self.cache.putRecords(sf_type, records)
+
+        for i in valid:
+            if i not in found:
+                retval.add(i)
+        for i in retval:
+            logger.error("Error: id '" + i + "' does not exist")
+
         return retval
 
+    """
+    helper, splits ids into query urls of max self.max_url characters
+
+    params
+    ------
+    purl: String, start of the query up to the opening bracket of the IN list
+    ids:  String[], list of ids
+
+    return
+    ------
+    generator, query urls
+    """
+    def idChunks(self, purl, ids):
+        chunk = []
+        size = len(self.instance_url) + len(purl) + 1
+        for i in ids:
+            if len(chunk) > 0 and size + len(i) + 3 > self.max_url:
+                yield purl + ",".join(chunk) + ")"
+                chunk = []
+                size = len(self.instance_url) + len(purl) + 1
+            chunk.append("'" + i + "'")
+            size = size + len(i) + 3
+        if len(chunk) > 0:
+            yield purl + ",".join(chunk) + ")"
+
     """
     function to evaluate different/ changing calls
     """
     def experimental(self):
         #self.exists('Account', ['0011r00001mj00xAAA', '0011r00001mj00yAAA', '0011r00001mj00zAAA', '0011r00001mj010AAA'])
-        bulk = Bulk(self.access_token, self.instance_url)
+        bulk = Bulk(self.access_token, self.instance_url, self.session, self.auth)
         #bulk.delete('tbdel.csv')
         bulk.insert()
         #self.exists('Account', ['0011r00001lskeAAAQ', '0011r00001lskeBBBQ', '0011r00001lsOsHAAU', '0011r00001lsadmAAA'])
@@ -448,19 +1364,31 @@ class Salesforce():
 Basic calls to work with Bulk API from Salesforce
 Processing data consists of following steps
 1 create a job
-2 add data to a batch
+2 add data to one or more batches
 3 close job
 4 check status
 5 receive recults
+
+a job may hold many batches, addBatches splits the data by the batch limits
+(max_records, max_bytes) and getResults polls all batches concurrently
 """
 
-class Bulk():
-    def __init__(self, access_token, instance_url):
-        self.timeout = 25.000
-        self.access_token = access_token
-        self.instance_url = instance_url
+class Bulk(Authorized):
+    def __init__(self, access_token, instance_url, session = None, auth = None):
+        Authorized.__init__(self, access_token, instance_url, session, auth)
         self.jobId = None
         self.batchId = None
+        self.batchIds = []
+        #limits of one batch
+        self.max_records = 10000
+        self.max_bytes = 10000000
+        #number of batch results fetched concurrently
+        self.workers = 8
+        self.polling = Backoff()
+        #called with the job info (dict) after each poll of the job
+        self.progress = None
+        #called with the batch id after a batch is added (e.g. to journal it)
+        self.added = None
 
     """
     creates a bulk job
@@ -474,11 +1402,11 @@ class Bulk():
         headers = { 'X-SFDC-Session' : self.access_token , 'Content-Type' : 'application/json' }
         url = self.instance_url + '/services/async/42.0/job'
         p = { 'operation' : operation, 'object' : obj, 'contentType' : 'JSON' }
-        r = requests.post(url, headers = headers, json=p, timeout=self.timeout)
+        r = self.send('POST', url, headers, json=p, timeout=self.timeout)
         if r.status_code >= 400:
             raise ValueError(r.json())
         self.jobId = r.json()['id']
-        print("Created Job with id:", self.jobId)
+        logger.info("Created Job with id: %s", self.jobId)
 
     """
     add a batch to the job
@@ -490,17 +1418,52 @@ class Bulk():
     def jbatch(self, data):
         headers = { 'X-SFDC-Session' : self.access_token , 'Content-Type' : 'application/json' }
         url = self.instance_url + '/services/async/42.0/job/' + self.jobId + '/batch'
-        r = requests.post(url, headers = headers, json=data, timeout=self.timeout)
+        r = self.send('POST', url, headers, json=data, timeout=self.timeout)
         
         if r.status_code >= 400:
             raise ValueError(r.text)
         
         self.batchId = r.json()['id']
-        print("Job Id", self.jobId)
-        print("BatchId", self.batchId)
-        print("------")
+        self.batchIds.append(self.batchId)
+        if self.added != None:
+            self.added(self.batchId)
+        logger.debug("added batch %s to job %s", self.batchId, self.jobId)
         
         return None
+
+    """
+    splits data into batches of max self.max_records records and
+    self.max_bytes serialized size and adds each batch to the job
+
+    params
+    ------
+    data: [], list of records (json dicts)
+    skip: int, number of batches already added (resumed job), these are not sent again
+
+    return
+    ------
+    number of batches
+    """
+    def addBatches(self, data, skip = 0):
+        chunk = []
+        size = 2
+        count = 0
+        for record in data:
+            length = len(json.dumps(record).encode('utf-8')) + 1
+            if len(chunk) > 0 and (len(chunk) >= self.max_records or size + length > self.max_bytes):
+                if count >= skip:
+                    self.jbatch(chunk)
+                count = count + 1
+                chunk = []
+                size = 2
+            chunk.append(record)
+            size = size + length
+        if len(chunk) > 0:
+            if count >= skip:
+                self.jbatch(chunk)
+            count = count + 1
+
+        return count
     
     """
     close the job
@@ -510,117 +1473,544 @@ class Bulk():
         url = self.instance_url + '/services/async/42.0/job/' + self.jobId
         p = { 'state' : 'UploadComplete' }
         p = { 'state' : 'Closed' }
-        r = requests.post(url, headers = headers, json=p, timeout=self.timeout)
-        print("Close", r.status_code)
-        print(r.text)
+        r = self.send('POST', url, headers, json=p, timeout=self.timeout)
+        logger.debug("closed job %s: %d %s", self.jobId, r.status_code, r.text)
 
     """
     checkBatch controls if a is completed
+    the batch is polled with self.polling (exponential backoff)
 
     params
     ------
-    synch: bool, if True call blocks until job is completed or failed
+    synch:   bool, if True call blocks until job is completed or failed
+    batchId: String, batch to check, default is the last added batch
 
     return True if batch is completed, False if Failed (sync), False if Queued, InProgress, Failed(async) 
     """
-    def checkBatch(self, sync = True):
+    def checkBatch(self, sync = True, batchId = None):
+        if batchId == None:
+            batchId = self.batchId
         headers = { 'X-SFDC-Session' : self.access_token , 'Content-Type' : 'application/json' }
-        url = self.instance_url + '/services/async/42.0/job/' + self.jobId + '/batch/' + self.batchId
-        while True:
-            r = requests.get(url, headers = headers, timeout=self.timeout)
+        url = self.instance_url + '/services/async/42.0/job/' + self.jobId + '/batch/' + batchId
+
+        def check():
+            r = self.send('GET', url, headers, timeout=self.timeout)
             state = r.json()['state']
             if state == 'Completed':
                 return True
             if state != 'Queued' and state != 'InProgress':
-                raise ValueError("Error in batch with id '" + self.batchId + "': " + state)
+                raise ValueError("Error in batch with id '" + batchId + "': " + state)
             if sync == True:
-                time.sleep(1)
-            else:
-                break
+                return None
+            return False
 
-        return False
+        return self.polling.poll(check)
 
     """
-    returns the response object successful Results, it blocks until job is 
-    successully processed or failed
+    returns the job info, it contains the state and the counters of
+    batches (numberBatchesCompleted, ...) and records (numberRecordsProcessed, numberRecordsFailed)
     """
-    def getSuccessfulResult(self):
-        if not self.checkBatch():
-            return None
+    def jobInfo(self):
+        headers = { 'X-SFDC-Session' : self.access_token , 'Content-Type' : 'application/json' }
+        url = self.instance_url + '/services/async/42.0/job/' + self.jobId
+        r = self.send('GET', url, headers, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(r.text)
+        return r.json()
+
+    """
+    blocks until all batches of the job are processed, only the job is polled
+    (one request for all batches), self.progress is called after each poll
+
+    return
+    ------
+    job info
+    """
+    def waitJob(self):
+        def check():
+            info = self.jobInfo()
+            if self.progress != None:
+                self.progress(info)
+            if info['numberBatchesCompleted'] + info['numberBatchesFailed'] < info['numberBatchesTotal']:
+                return None
+            return info
+
+        info = self.polling.poll(check)
+        if info['numberBatchesFailed'] > 0:
+            headers = { 'X-SFDC-Session' : self.access_token , 'Content-Type' : 'application/json' }
+            url = self.instance_url + '/services/async/42.0/job/' + self.jobId + '/batch'
+            r = self.send('GET', url, headers, timeout=self.timeout)
+            for batch in r.json()['batchInfo']:
+                if batch['state'] == 'Failed':
+                    raise ValueError("Error in batch with id '" + batch['id'] + "': " + batch.get('stateMessage', 'Failed'))
+        return info
+
+    """
+    returns the response object with the results of a processed batch
+    """
+    def getResult(self, batchId):
         headers = { 'X-SFDC-Session' : self.access_token , 'Content-Type' : 'application/json' }
-        url = self.instance_url + '/services/async/42.0/job/' + self.jobId + '/batch/' + self.batchId + '/result'
-        r = requests.get(url, headers = headers, timeout=self.timeout)
+        url = self.instance_url + '/services/async/42.0/job/' + self.jobId + '/batch/' + batchId + '/result'
+        r = self.send('GET', url, headers, timeout=self.timeout)
         if r.status_code >= 400:
             raise ValueError(r.text)
         return r
 
+    """
+    returns the response object successful Results, it blocks until job is 
+    successully processed or failed
+
+    params
+    ------
+    batchId: String, default is the last added batch
+    """
+    def getSuccessfulResult(self, batchId = None):
+        if batchId == None:
+            batchId = self.batchId
+        if not self.checkBatch(batchId = batchId):
+            return None
+        return self.getResult(batchId)
+
+    """
+    waits for all batches of the job and returns their results (fetched concurrently),
+    it blocks until all batches are processed or one failed
+
+    return
+    ------
+    list of results (json dicts), in order of the added records
+    """
+    def getResults(self):
+        if len(self.batchIds) == 0:
+            return []
+        self.waitJob()
+        retval = []
+        workers = min(self.workers, len(self.batchIds))
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            for r in pool.map(self.getResult, self.batchIds):
+                retval.extend(r.json())
+        return retval
+
+"""
+progress callback for Bulk jobs, logs the job counters
+"""
+def printProgress(info):
+    logger.info("job " + info['id'] + ": batches " + str(info['numberBatchesCompleted']) + "/" + str(info['numberBatchesTotal']) +
+            ", records processed " + str(info['numberRecordsProcessed']) + ", failed " + str(info['numberRecordsFailed']))
+
 def usage():
-        print("""usage: salesforce <options>
-                 -a|--accounts:                list all accounts predefined fields, csv output
-                 -e|--experimental:            changing usage for experimental code
-                 -d|--dedup <list of ids>:     group ids to a duplicate set
-                 --filededup <file>             group first 10 groups to salesforce, file is
-                                               output from identity
-                 --clean:                      deletes all "Test_Regel" DuplicateRecordSet
-                 --delete <ids>:               list of object ids to be deleted
-                                                 sf_type must be set
-                 -l|--list:                    list all objects, csv output
+        print("""usage: salesforce <command> [<argument>] <options>
+       salesforce <options>
+       commands (or the option in brackets, options can select several commands):
+                 list (-l|--list):             list all objects, csv output
                                                  sf_type must be set
+                 accounts (-a|--accounts):     list all accounts predefined fields, csv output
+                 dedup <groups>                group ids to a duplicate set, groups are separated
+                   (-d|--dedup <groups>):        by ';' (e.g. "id1,id2;id3,id4")
+                 filededup <file>              create the duplicate groups of the file in salesforce,
+                   (--filededup <file>):         file is output from identity
+                 clean (--clean):              deletes all "Test_Regel" DuplicateRecordSet
+                 delete <ids>                  comma separated list of object ids to be deleted
+                   (--delete <ids>):             sf_type must be set
+                 bulk-export <file>            export fields of all objects to a csv file
+                   (--bulk-export <file>):       with Bulk API 2.0, sf_type must be set
+                 bulk-load <file>              load a csv file with Bulk API 2.0,
+                   (--bulk-load <file>):         sf_type must be set
+                 experimental                  changing usage for experimental code
+                   (-e|--experimental)
+       options:
+                 --dry-run:                    print the requests of the commands without login,
+                                                 fields are validated with cached describe metadata
+                 --limit <n>:                  max number of groups of filededup (default all)
+                 --prefetch <n>:               fetch up to n query pages in advance
+                                                 while the current page is written
+                 --stats:                      print network/processing times, calls, latencies and
+                                                 sizes per operation and a latency histogram to stderr
+                 --trace <file>:               append each request (operation, status, latency, bytes,
+                                                 retries, API usage) as json line to file
+                 --profile:                    print a cProfile report of the transform of the pages
+                 -v|--verbose:                 log debug messages (requests, jobs, batches) to stderr
+                 -q|--quiet:                   log only warnings and errors
+                 --progress:                   print progress of Bulk jobs to stderr
+                 --max-wait <sec>:             give up waiting for a Bulk job after sec seconds
+                                                 (default no limit)
+                 --concurrency <n>:            send up to n requests at the same time for
+                                                 dedup, delete, clean (max 25)
+                 --rate <n>:                   send max n requests per second
+                 --api-ceiling <fraction>:     slow down to 1 request per second when this
+                                                 fraction of the daily API limit is used (default 0.9)
+                 --no-token-cache:             always login, do not reuse a cached token
+                 --cache <file>:               keep query results and looked up records in a sqlite
+                                                 file, reused by following runs
+                 --cache-ttl <sec>:            seconds a cached entry is valid (default 3600)
+                 --describe-ttl <sec>:         seconds the describe metadata is reused from
+                                                 ~/.sfconnect/describe.sqlite (default 86400)
+                 --resume:                     continue the interrupted run of list, accounts, delete, clean,
+                                                 filededup from its checkpoints (same options)
+                 --journal <file>:             checkpoint file (default one file per command line
+                                                 in ~/.sfconnect/journals), removed when all
+                                                 commands are finished
+                 --pool-size <n>:              max kept alive connections per host (default 10)
+                 --retries <n>:                retries on connection errors (default 3)
+                 --timeout <sec>:              timeout per request (default 25)
                  -s|--sf_type <sf_object>:     set sf_type
-                 -f|--fields <list od fields>: print fields (only available for -l|--list)
-                                                 default is id
+                 -f|--fields <list of fields>: print fields (list and bulk-export)
+                                                 default is id, "*" for all fields, relationship
+                                                 paths like Owner.Name, fields are validated
+                                                 before the export starts
+                 --out <file>:                 write csv output of list, accounts to file
+                 --partitions <n>:             list: split the object into n Id ranges, which are
+                                                 queried at the same time, if --out contains
+                                                 {part} each range is written to its own file
+                 --compress <gzip|zstd>:       compress csv output (zstd needs zstandard)
+                 --raw:                        keep all characters (values are quoted if needed)
+                 --sync <dir>:                 with list: update a local snapshot in dir with the records
+                                                 changed since the last run, output the snapshot
+                 --full:                       with --sync: load all records again
+                 --format <parquet|arrow>:     write output of list as Parquet or Arrow IPC file
+                                                 with typed columns, --out must be set (needs pyarrow)
+                 --operation <op>:             operation of bulk-load: insert (default),
+                                                 update, upsert, delete
+                 --external-id <field>:        external id field for upsert
                 """)
 
+#commands of the command line: salesforce <command> [options] [argument], the
+#options -l, -a, -d, --filededup, --clean, --delete, --bulk-export, --bulk-load, -e
+#select the same commands
+COMMANDS = ('list', 'accounts', 'dedup', 'filededup', 'clean', 'delete', 'bulk-export', 'bulk-load', 'experimental')
+#commands with an argument (groups, ids or file)
+ARGUMENTS = ('dedup', 'filededup', 'delete', 'bulk-export', 'bulk-load')
+#commands that write checkpoints to the journal (list and accounts only with --out)
+CHECKPOINTS = ('list', 'accounts', 'delete', 'clean', 'filededup')
+SHORT_OPTIONS = "aed:f:ls:vq"
+LONG_OPTIONS = ['accounts', 'experimental', 'dedup=', \
+        'fields=', 'sf_type=', 'list', 'delete=', 'clean', 'filededup=', 'limit=', \
+        'prefetch=', 'stats', 'pool-size=', 'retries=', 'timeout=', 'progress', \
+        'bulk-export=', 'bulk-load=', 'operation=', 'external-id=', 'concurrency=', \
+        'rate=', 'api-ceiling=', 'no-token-cache', 'out=', 'compress=', 'raw', \
+        'format=', 'sync=', 'full', 'cache=', 'cache-ttl=', 'max-wait=', \
+        'resume', 'journal=', 'partitions=', 'trace=', 'profile', \
+        'verbose', 'quiet', 'describe-ttl=', 'dry-run']
+LEGACY = { '-l' : 'list', '--list' : 'list', '-a' : 'accounts', '--accounts' : 'accounts',
+        '-d' : 'dedup', '--dedup' : 'dedup', '--filededup' : 'filededup', '--clean' : 'clean',
+        '--delete' : 'delete', '--bulk-export' : 'bulk-export', '--bulk-load' : 'bulk-load',
+        '-e' : 'experimental', '--experimental' : 'experimental' }
+
+"""
+parses and validates the command line, nothing is sent (no login) before
+the arguments are valid
+
+params
+------
+argv: [], command line arguments
+
+return
+------
+(commands, params): list of (command, argument) in order of the command line,
+dict of the options; raises getopt.GetoptError or ValueError with the reason
+"""
+def parseArgs(argv):
+    def number(opt, arg, kind = int):
+        try:
+            return kind(arg)
+        except ValueError:
+            raise ValueError(opt + " needs a number, not '" + arg + "'")
+
+    opts, args = getopt.gnu_getopt(argv, SHORT_OPTIONS, LONG_OPTIONS)
+    params = { 'sf_type' : None, 'fields' : 'Id', 'out' : None, 'compress' : None, 'sanitize' : True,
+            'format' : 'csv', 'snapshots' : None, 'full' : False, 'limit' : None, 'partitions' : None,
+            'operation' : 'insert', 'external_id' : None, 'prefetch' : None, 'stats' : False,
+            'profile' : False, 'progress' : False, 'max_wait' : None, 'dry_run' : False, 'level' : logging.INFO,
+            'trace' : None, 'token_cache' : True, 'cache' : ':memory:', 'cache_ttl' : 3600,
+            'describe_ttl' : 86400, 'resume' : False, 'rate' : None, 'api_ceiling' : None,
+            'concurrency' : 1, 'session' : {},
+            'journal' : None }
+    commands = []
+    for opt, arg in opts:
+        if opt in LEGACY:
+            commands.append((LEGACY[opt], arg if LEGACY[opt] in ARGUMENTS else None))
+        if opt in ('-s', '--sf_type'):
+            params['sf_type'] = arg
+        if opt in ('-f', '--fields'):
+            params['fields'] = arg
+        if opt in (['--out']):
+            params['out'] = arg
+        if opt in (['--compress']):
+            params['compress'] = arg
+        if opt in (['--raw']):
+            params['sanitize'] = False
+        if opt in (['--format']):
+            params['format'] = arg
+        if opt in (['--sync']):
+            params['snapshots'] = arg
+        if opt in (['--full']):
+            params['full'] = True
+        if opt in (['--limit']):
+            params['limit'] = number(opt, arg)
+        if opt in (['--partitions']):
+            params['partitions'] = number(opt, arg)
+        if opt in (['--operation']):
+            params['operation'] = arg
+        if opt in (['--external-id']):
+            params['external_id'] = arg
+        if opt in (['--prefetch']):
+            params['prefetch'] = number(opt, arg)
+        if opt in (['--stats']):
+            params['stats'] = True
+        if opt in (['--profile']):
+            params['profile'] = True
+        if opt in (['--progress']):
+            params['progress'] = True
+        if opt in (['--max-wait']):
+            params['max_wait'] = number(opt, arg, float)
+        if opt in (['--dry-run']):
+            params['dry_run'] = True
+        if opt in ('-v', '--verbose'):
+            params['level'] = logging.DEBUG
+        if opt in ('-q', '--quiet'):
+            params['level'] = logging.WARNING
+        if opt in (['--trace']):
+            params['trace'] = arg
+        if opt in (['--no-token-cache']):
+            params['token_cache'] = False
+        if opt in (['--cache']):
+            params['cache'] = arg
+        if opt in (['--cache-ttl']):
+            params['cache_ttl'] = number(opt, arg)
+        if opt in (['--describe-ttl']):
+            params['describe_ttl'] = number(opt, arg)
+        if opt in (['--journal']):
+            params['journal'] = arg
+        if opt in (['--resume']):
+            params['resume'] = True
+        if opt in (['--rate']):
+            params['rate'] = number(opt, arg, float)
+        if opt in (['--api-ceiling']):
+            params['api_ceiling'] = number(opt, arg, float)
+        if opt in (['--concurrency']):
+            params['concurrency'] = min(number(opt, arg), MAX_CONCURRENCY)
+        if opt in (['--pool-size']):
+            params['session']['pool_size'] = number(opt, arg)
+        if opt in (['--retries']):
+            params['session']['retries'] = number(opt, arg)
+        if opt in (['--timeout']):
+            params['session']['timeout'] = number(opt, arg, float)
+
+    if len(args) > 0:
+        if args[0] not in COMMANDS:
+            raise ValueError("unknown command '" + args[0] + "', use " + ", ".join(COMMANDS))
+        if len(args) > (2 if args[0] in ARGUMENTS else 1):
+            raise ValueError("unexpected argument '" + args[-1] + "'")
+        commands.append((args[0], args[1] if len(args) > 1 else None))
+    if len(commands) == 0:
+        raise ValueError("no command")
+
+    if params['limit'] != None and params['limit'] < 1:
+        raise ValueError("--limit must be at least 1")
+    if params['format'] not in ('csv', 'parquet', 'arrow'):
+        raise ValueError("unknown format '" + params['format'] + "', use csv, parquet, arrow")
+    if params['compress'] not in (None, 'gzip', 'zstd'):
+        raise ValueError("unknown compression '" + params['compress'] + "', use gzip, zstd")
+    #optional packages, checked without loading them
+    if params['format'] != 'csv' and importlib.util.find_spec('pyarrow') == None:
+        raise ValueError("format " + params['format'] + " needs the package pyarrow")
+    if params['compress'] == 'zstd' and importlib.util.find_spec('zstandard') == None:
+        raise ValueError("compression zstd needs the package zstandard")
+    if params['operation'] not in ('insert', 'update', 'upsert', 'delete'):
+        raise ValueError("unknown operation '" + params['operation'] + "', use insert, update, upsert, delete")
+    for command, arg in commands:
+        if command in ARGUMENTS and not arg:
+            raise ValueError(command + ": argument is missing")
+        if command in ('list', 'delete', 'bulk-export', 'bulk-load') and params['sf_type'] == None:
+            raise ValueError(command + ": sf_type must be set (-s)")
+        if command in ('filededup', 'bulk-load') and not os.path.isfile(arg):
+            raise ValueError(command + ": file '" + arg + "' does not exist")
+        if command == 'list' and params['format'] != 'csv' and params['out'] == None:
+            raise ValueError(command + ": --format " + params['format'] + " needs --out")
+        if command == 'bulk-load' and params['operation'] == 'upsert' and params['external_id'] == None:
+            raise ValueError(command + ": upsert needs --external-id")
+    #one connection per concurrent request (a thread per partition of list)
+    connections = max(params['concurrency'], min(params['partitions'] or 0, MAX_CONCURRENCY))
+    if connections > 10 and 'pool_size' not in params['session']:
+        params['session']['pool_size'] = connections
+
+    return commands, params
+
+"""
+runs one command
+
+params
+------
+sf:      Salesforce, logged in
+command: String, see COMMANDS
+arg:     argument of the command (groups, ids or file)
+params:  dict, options, see parseArgs
+"""
+def run(sf, command, arg, params):
+    sf_type = params['sf_type']
+    fields = params['fields']
+    out = params['out']
+    compress = params['compress']
+    sanitize = params['sanitize']
+    if command == 'list':
+        logger.debug("listing %s %s", sf_type, fields)
+        if params['snapshots'] != None:
+            from delta import DeltaSync
+            fields = sf.metadata.compile(sf_type, fields).fields
+            delta = DeltaSync(sf, params['snapshots'])
+            changed, deleted = delta.sync(sf_type, fields, params['full'])
+            logger.info("Changed %d records, deleted %d", changed, deleted)
+            sf.writeCsv(delta.lines(sf_type, fields, sanitize), out, compress)
+        elif params['format'] == 'csv' and params['partitions'] != None:
+            count = sf.exportPartitioned(sf_type, fields, params['partitions'], out, compress, sanitize)
+            logger.info("Exported %d records", count)
+        elif params['format'] == 'csv':
+            sf.listObjectsCsv(sf_type, fields, out, compress, sanitize)
+        else:
+            logger.info("Exported %d records", sf.exportColumnar(sf_type, fields, out, params['format']))
+    elif command == 'accounts':
+        sf.listAccounts(out, compress, sanitize)
+    elif command == 'dedup':
+        sf.deduplicateGroups([group.split(',') for group in arg.split(';')])
+    elif command == 'filededup':
+        sf.createDuplicatesFromFile(arg, params['limit'])
+    elif command == 'clean':
+        sf.clean('Test_Regel')
+    elif command == 'delete':
+        sf.delete(sf_type, arg)
+    elif command == 'bulk-export':
+        logger.info("Exported %d records", sf.bulkExport(sf_type, fields, arg))
+    elif command == 'bulk-load':
+        processed, failed = sf.bulkLoad(params['operation'], sf_type, arg, params['external_id'])
+        logger.info("Processed %d records, failed %d", processed, failed)
+    elif command == 'experimental':
+        sf.experimental()
+
+"""
+opens the journal of the command line, a file journal (see journal.journalPath)
+is only used if a command writes checkpoints or --resume or --journal is
+given, else the journal is kept in memory, so concurrent runs of the same
+command line do not conflict
+
+params
+------
+commands: [], (command, argument), see parseArgs
+params:   dict, options, see parseArgs
+
+return
+------
+Journal, raises ValueError if the journal file is used by another run
+"""
+def openJournal(commands, params):
+    path = params['journal']
+    checkpoints = [c for c, arg in commands if c in CHECKPOINTS and (c not in ('list', 'accounts') or params['out'] != None)]
+    if path == None and len(checkpoints) == 0 and not params['resume']:
+        return Journal()
+    if path == None:
+        #the options that change the work of the commands
+        path = journalPath(os.path.join(os.path.expanduser('~'), '.sfconnect', 'journals'), [commands] +
+                [params[k] for k in ('sf_type', 'fields', 'out', 'compress', 'sanitize', 'format', 'snapshots',
+                'full', 'limit', 'partitions', 'operation', 'external_id')])
+    return Journal(path, params['resume'])
+
+"""
+prints the startup times (seconds): imports, arguments, login
+
+params
+------
+startup: dict, name -> seconds, in order of the phases
+out:     stream, default stderr (stdout carries the data)
+"""
+def reportStartup(startup, out = None):
+    if out == None:
+        out = sys.stderr
+    print("startup: " + ", ".join(["%s %.3fs" % (name, seconds) for name, seconds in startup.items()]), file=out)
+
 def main(argv):
+    begin = time.perf_counter()
     try:
-        opts, args = getopt.getopt(argv, "aed:f:ls:", ['accounts', 'experimental', 'dedup=', \
-                'fields=', 'sf_type=', 'list', 'delete=', 'clean', 'filededup='])
-    except getopt.GetoptError:
+        commands, params = parseArgs(argv)
+    except (getopt.GetoptError, ValueError) as e:
+        print("error: " + str(e), file=sys.stderr)
         usage()
-        return
-    token, url = Auth().auth()
-    sf = Salesforce(token, url)
-    fields = 'Id'
-    mode = 0
-    ids = None
-    sf_type = None
-    for opt, arg in opts:
-        if opt in ('--filededup'):
-            sf.createDuplicatesFromFile(arg, 10)
-        if opt in ('-a', '--accounts'):
-            sf.listAccounts()
-        if opt in ('-e', '--experimental'):
-            sf.experimental()
-        if opt in ('-d', '--dedup'):
-            objects = arg.split(',')
-            sf.deduplicate(objects)
-        if opt in ('--delete'):
-            ids = arg
-        if opt in ('-f', '--fields'):
-            fields = arg
-        if opt in ('-s', '--sf_type'):
-            sf_type = arg
-        if opt in (['--clean']):
-            sf.clean('Test_Regel')
-        if opt in (['--delete']):
-            mode = 'delete'
-        if opt in ('-l', '--list'):
-            mode = 'list'
-    
-    if mode == 'list':
-        if sf_type == None:
-            usage()
-            return
-        print(sf_type, fields)
-        sf.listObjectsCsv(sf_type, fields)
-    elif mode == 'delete':
-        if sf_type == None or ids == None:
-            usage()
-            return
-        sf.delete(sf_type, ids)
+        return 2
+    #stdout carries only data
+    logging.basicConfig(stream = sys.stderr, level = params['level'], format = '%(levelname)s: %(message)s')
+    #urllib3 logs the urls of the requests
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    startup = { 'imports' : begin - STARTED, 'arguments' : time.perf_counter() - begin }
+
+    begin = time.perf_counter()
+    describe = os.path.join(os.path.expanduser('~'), '.sfconnect', 'describe.sqlite')
+    if params['dry_run']:
+        #no login, the instance of a cached token finds the cached describe metadata
+        import dryrun
+        token, url = TokenCache().get(tokenKey()) if params['token_cache'] else (None, None)
+        sf = Salesforce(None, url or 'https://<instance>')
+        if os.path.exists(describe):
+            sf.metadata = Metadata(sf, Cache(describe, params['describe_ttl']))
+        for command, arg in commands:
+            print("# " + command + ("" if arg == None else " " + arg[:60]))
+            dryrun.plan(sf, command, arg, params).write()
+        startup['plan'] = time.perf_counter() - begin
+        reportStartup(startup)
+        return 0
+
+    scheduler = Scheduler()
+    if params['rate'] != None:
+        scheduler.rate = params['rate']
+    if params['api_ceiling'] != None:
+        scheduler.ceiling = params['api_ceiling']
+    recorder = Recorder(params['trace'])
+    configure(scheduler = scheduler, recorder = recorder, **params['session'])
+    auth = Auth(cache = TokenCache() if params['token_cache'] else None)
+    try:
+        journal = openJournal(commands, params)
+    except ValueError as e:
+        print("error: " + str(e), file=sys.stderr)
+        return 2
+    token, url = auth.auth()
+    startup['login'] = time.perf_counter() - begin
+    logger.debug("startup: imports %.3fs, arguments %.3fs, login %.3fs", startup['imports'], startup['arguments'], startup['login'])
+    sf = Salesforce(token, url, auth = auth)
+    sf.concurrency = params['concurrency']
+    sf.cache = Cache(params['cache'], params['cache_ttl'])
+    sf.journal = journal
+    sf.metadata = Metadata(sf, Cache(describe, params['describe_ttl']))
+    if params['prefetch'] != None:
+        sf.prefetch = params['prefetch']
+    if params['profile']:
+        sf.profiler = Profiler()
+    if params['progress']:
+        sf.progress = printProgress
+    sf.polling.max_wait = params['max_wait']
+    if params['rate'] != None or params['api_ceiling'] != None:
+        #the ceiling applies from the first request, not only after a response with Sforce-Limit-Info
+        sf.limits()
+
+    try:
+        for command, arg in commands:
+            run(sf, command, arg, params)
+    except (ValueError, LookupError) as e:
+        #e.g. unknown fields or rejected requests, the journal is kept for --resume
+        print("error: " + str(e), file=sys.stderr)
+        recorder.close()
+        journal.close()
+        return 2
+
+    if params['stats']:
+        reportStartup(startup)
+        sf.stats.report()
+        scheduler.report()
+        recorder.report()
+    if sf.profiler != None:
+        sf.profiler.report()
+    recorder.close()
+    #all commands are finished, nothing to resume
+    journal.remove()
+    return 0
 
 #TODO: create DuplicateRule
 #      cleanup
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
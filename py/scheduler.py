@@ -0,0 +1,171 @@
+# File name: scheduler.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import re
+import sys
+import time
+import random
+import threading
+
+
+"""
+schedules the requests of a session with respect to the API limits of the org
+
+- the API usage is read from the Sforce-Limit-Info header of each response
+  (or set from the /limits resource)
+- requests are throttled with a token bucket, when the usage reaches ceiling
+  (fraction of the daily limit) the rate is reduced to slow_rate
+- responses 503 and REQUEST_LIMIT_EXCEEDED are retried after Retry-After or
+  with exponential backoff
+- the number of calls is counted per operation
+
+    rate:      float, requests per second (None: not throttled below the ceiling)
+    burst:     int, max number of requests sent without waiting
+    ceiling:   float, fraction of the daily API limit from which slow_rate is used
+    slow_rate: float, requests per second above the ceiling
+    retries:   int, max retries of a request
+    backoff:   float, first delay of a retry in seconds (doubled per retry)
+    max_delay: float, max delay of a retry in seconds
+"""
+class Scheduler():
+    def __init__(self, rate = None, burst = 10, ceiling = 0.9, slow_rate = 1.0, retries = 5, backoff = 1.0, max_delay = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.ceiling = ceiling
+        self.slow_rate = slow_rate
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.used = None
+        self.limit = None
+        self.counters = {}
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.usageexp = re.compile('api-usage=(\\d+)/(\\d+)')
+
+    """
+    returns the current rate (requests per second), None if not throttled
+    """
+    def currentRate(self):
+        if self.used != None and self.limit and self.used >= self.ceiling * self.limit:
+            if self.rate == None:
+                return self.slow_rate
+            return min(self.rate, self.slow_rate)
+        return self.rate
+
+    """
+    blocks until the request may be sent
+    """
+    def acquire(self):
+        while True:
+            with self.lock:
+                rate = self.currentRate()
+                now = time.monotonic()
+                if rate == None:
+                    self.last = now
+                    return
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                wait = (1 - self.tokens) / rate
+            time.sleep(wait)
+
+    """
+    counts the call and reads the API usage from the response
+
+    params
+    ------
+    op: String, name of the operation
+    r:  response
+    """
+    def update(self, op, r):
+        with self.lock:
+            self.counters[op] = self.counters.get(op, 0) + 1
+            m = self.usageexp.search(r.headers.get('Sforce-Limit-Info', ''))
+            if m:
+                self.setUsage(int(m.group(1)), int(m.group(2)))
+
+    """
+    sets the API usage (e.g. read from the /limits resource)
+
+    params
+    ------
+    used:  int, API requests used today
+    limit: int, max API requests per day
+    """
+    def setUsage(self, used, limit):
+        self.used = used
+        self.limit = limit
+
+    """
+    decides if a request has to be retried
+
+    params
+    ------
+    r:       response
+    attempt: int, number of retries so far
+
+    return
+    ------
+    delay in seconds before the retry, None if not to be retried
+    """
+    def retryDelay(self, r, attempt):
+        if attempt >= self.retries:
+            return None
+        limited = r.status_code == 403 and b'REQUEST_LIMIT_EXCEEDED' in r.content
+        if r.status_code != 503 and not limited:
+            return None
+        after = r.headers.get('Retry-After')
+        if after != None and after.isdigit():
+            return min(float(after), self.max_delay)
+        delay = min(self.backoff * 2 ** attempt, self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    """
+    prints the calls per operation and the API usage
+
+    params
+    ------
+    out: stream, default stderr (stdout carries the data)
+    """
+    def report(self, out = None):
+        if out == None:
+            out = sys.stderr
+        for op in sorted(self.counters):
+            print("%-40s %d" % (op, self.counters[op]), file=out)
+        if self.limit != None:
+            print("API usage: %d/%d" % (self.used, self.limit), file=out)
+
+
+"""
+returns a short name of the operation of a request, e.g.
+    GET  /services/data/v42.0/query?q=...            -> GET query
+    POST /services/async/42.0/job/<id>/batch         -> POST job/batch
+    GET  /services/data/v42.0/sobjects/Account/<id>  -> GET sobjects/Account
+
+params
+------
+method: String
+url:    String
+
+return
+------
+String
+"""
+def operation(method, url):
+    path = re.sub('^[a-z]+://[^/]+', '', url).split('?')[0]
+    path = re.sub('^/services/(data/v[0-9.]+/|async/[0-9.]+/)?', '', path)
+    names = []
+    for part in path.strip('/').split('/'):
+        #skip ids and query locators
+        if re.match('^[a-zA-Z0-9]{15}([a-zA-Z0-9]{3})?$', part) and re.search('[0-9]', part):
+            continue
+        if '-' in part:
+            continue
+        names.append(part)
+    return method + " " + "/".join(names[:2])
@@ -0,0 +1,150 @@
+# File name: session.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import time
+import threading
+
+from scheduler import Scheduler, operation
+from instrument import Recorder
+
+
+"""
+HTTP session shared by Auth, Salesforce and Bulk
+connections are pooled and kept alive, so repeated calls to the same instance
+do not need a new TCP and TLS handshake
+
+    pool_size: int, max number of kept alive connections per host
+    retries:   int, retries on connection errors and 502/504 responses
+               (requests that are not idempotent are only retried if they were not sent)
+    timeout:   float, default timeout in seconds for each request
+    backoff:   float, backoff factor between retries
+    scheduler: Scheduler, throttles the requests and counts them per operation
+    recorder:  Recorder, records status, latency, size and retries of each request
+"""
+class Session():
+    def __init__(self, pool_size = 10, retries = 3, timeout = 25.000, backoff = 0.5, scheduler = None, recorder = None):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.scheduler = scheduler if scheduler != None else Scheduler()
+        self.recorder = recorder if recorder != None else Recorder()
+        self.retries = retries
+        self.backoff = backoff
+        #requests session, created with the first request
+        self.http = None
+        self.lock = threading.Lock()
+
+    """
+    returns the requests session, it is created on first use, so usage and
+    --dry-run do not load requests
+    """
+    def connect(self):
+        with self.lock:
+            if self.http != None:
+                return self.http
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            #503 and Retry-After are handled by the scheduler
+            retry = Retry(total = self.retries, backoff_factor = self.backoff,
+                    status_forcelist = (502, 504), raise_on_status = False, respect_retry_after_header = False)
+            adapter = HTTPAdapter(pool_connections = self.pool_size, pool_maxsize = self.pool_size, max_retries = retry)
+            http = requests.Session()
+            http.mount('https://', adapter)
+            http.mount('http://', adapter)
+            self.http = http
+            return http
+
+    """
+    sends a request, if no timeout is given the default timeout is used
+    the request is scheduled by self.scheduler and retried on 503 or
+    REQUEST_LIMIT_EXCEEDED
+
+    params
+    ------
+    method: String, GET, POST, ...
+    url:    String, full url
+    kwargs: passed to requests
+
+    return
+    ------
+    response
+    """
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') == None:
+            kwargs['timeout'] = self.timeout
+        op = operation(method, url)
+        data = kwargs.get('data')
+        start = data.tell() if hasattr(data, 'seek') else None
+        attempt = 0
+        retries = 0
+        begin = time.perf_counter()
+        http = self.connect()
+        while True:
+            self.scheduler.acquire()
+            r = http.request(method, url, **kwargs)
+            self.scheduler.update(op, r)
+            #retries of connection errors and 502/504 by urllib3
+            history = getattr(getattr(r.raw, 'retries', None), 'history', None)
+            retries = retries + (0 if history == None else len(history))
+            delay = self.scheduler.retryDelay(r, attempt)
+            if delay == None:
+                self.recorder.record(op, method, url, r, time.perf_counter() - begin, retries, kwargs.get('stream', False))
+                return r
+            r.close()
+            time.sleep(delay)
+            attempt = attempt + 1
+            retries = retries + 1
+            if start != None:
+                #upload the file again
+                data.seek(start)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        if self.http != None:
+            self.http.close()
+
+
+_session = None
+_lock = threading.Lock()
+
+"""
+returns the shared session, it is created with default values on first use
+"""
+def getSession():
+    global _session
+    with _lock:
+        if _session == None:
+            _session = Session()
+        return _session
+
+"""
+replaces the shared session by a new one with the given settings
+(pool_size, retries, timeout, backoff, scheduler, recorder see Session)
+
+return
+------
+the new shared session
+"""
+def configure(**kwargs):
+    global _session
+    with _lock:
+        if _session != None:
+            _session.close()
+        _session = Session(**kwargs)
+        return _session
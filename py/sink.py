@@ -0,0 +1,113 @@
+# File name: sink.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import io
+import sys
+import csv
+import gzip
+
+
+"""
+output of csv lines, written with a buffered csv.writer (values containing
+the delimiter, quotes or line breaks are quoted) to stdout or a file,
+optionally compressed
+
+    path:        String, output file, None for stdout
+    delimiter:   String, field separator
+    compress:    String, None, 'gzip' or 'zstd' (needs the zstandard package)
+    buffer_size: int, size of the write buffer in bytes
+    append:      bool, append to an existing file
+"""
+class CsvSink():
+    def __init__(self, path = None, delimiter = ';', compress = None, buffer_size = 1024 * 1024, append = False):
+        self.path = path
+        self.raw = None
+        self.compressed = None
+        if compress == None and path == None:
+            self.stream = sys.stdout
+        elif compress == None:
+            self.stream = open(path, 'a' if append else 'w', newline='', encoding='utf-8', buffering=buffer_size)
+        else:
+            if path == None:
+                self.raw = sys.stdout.buffer
+            else:
+                self.raw = open(path, 'ab' if append else 'wb', buffering=buffer_size)
+            self.compressed = self.compressor(compress, self.raw)
+            self.stream = io.TextIOWrapper(self.compressed, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.stream, delimiter=delimiter, lineterminator='\n')
+        self.count = 0
+
+    """
+    returns a binary stream compressing to raw
+    """
+    def compressor(self, compress, raw):
+        if compress == 'gzip':
+            return gzip.GzipFile(fileobj=raw, mode='wb')
+        if compress == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("compression zstd needs the package zstandard")
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        raise ValueError("unknown compression '" + compress + "', use gzip or zstd")
+
+    """
+    writes lines
+
+    params
+    ------
+    lines: iterable of lines (sequence of Strings), e.g. a generator
+
+    return
+    ------
+    number of lines written
+    """
+    def write(self, lines):
+        count = self.count
+        for line in lines:
+            self.writer.writerow(line)
+            self.count = self.count + 1
+        return self.count - count
+
+    """
+    writes the buffered lines to the file (e.g. before a checkpoint), a
+    compressed stream is flushed to a block boundary
+
+    return
+    ------
+    size of the written output in bytes (file position of the uncompressed
+    output, None for stdout)
+    """
+    def flush(self):
+        self.stream.flush()
+        if self.compressed != None:
+            self.compressed.flush()
+            self.raw.flush()
+            return None
+        if self.path == None:
+            return None
+        return self.stream.buffer.tell()
+
+    """
+    flushes the buffers and closes the file (stdout is only flushed)
+    """
+    def close(self):
+        if self.compressed != None:
+            #closes the compressor, which writes the end of the stream
+            self.stream.close()
+        else:
+            self.stream.flush()
+        if self.raw != None and self.path != None:
+            self.raw.close()
+        elif self.raw != None:
+            self.raw.flush()
+        elif self.path != None:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,101 @@
+# File name: tokencache.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import os
+import json
+import time
+
+try:
+    import fcntl
+except ImportError:
+    #no file locking (e.g. Windows)
+    fcntl = None
+
+
+"""
+persistent cache of access tokens, a json file keyed by username and login url
+the file is locked while it is read or written, so concurrent invocations
+(e.g. from cron) share one token
+
+    path: String, cache file, default ~/.sfconnect/tokens.json
+    ttl:  int, seconds a token is reused after it was issued
+"""
+class TokenCache():
+    def __init__(self, path = None, ttl = 7200):
+        if path == None:
+            path = os.path.join(os.path.expanduser('~'), '.sfconnect', 'tokens.json')
+        self.path = path
+        self.ttl = ttl
+
+    """
+    returns the cached token
+
+    params
+    ------
+    key: String, e.g. username@login url
+
+    return
+    ------
+    access_token, instance_url or None, None if there is no valid token
+    """
+    def get(self, key):
+        with Lock(self.path):
+            entry = self.read().get(key)
+        if entry == None or entry['issued'] + self.ttl < time.time():
+            return None, None
+        return entry['access_token'], entry['instance_url']
+
+    """
+    stores a token
+
+    params
+    ------
+    key:          String, e.g. username@login url
+    access_token: String
+    instance_url: String
+    """
+    def put(self, key, access_token, instance_url):
+        with Lock(self.path):
+            tokens = self.read()
+            tokens[key] = { 'access_token' : access_token, 'instance_url' : instance_url, 'issued' : time.time() }
+            self.write(tokens)
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def write(self, tokens):
+        tmp = self.path + '.tmp'
+        #tokens are secrets, only readable by the user
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.replace(tmp, self.path)
+
+
+"""
+exclusive lock of a file (a separate .lock file is locked)
+"""
+class Lock():
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self.f = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if directory != '':
+            os.makedirs(directory, 0o700, exist_ok = True)
+        self.f = open(self.path, 'a')
+        if fcntl != None:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl != None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
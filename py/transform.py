@@ -0,0 +1,125 @@
+# File name: transform.py
+# Author: Gunter Fritz
+# Copyright: Gunter Fritz
+# Lizenz: Apache v 2.0
+
+import re
+import string
+
+
+#characters kept by the sanitizer, all others are replaced by ' '
+ALLOWED = set(string.ascii_letters + string.digits + '@ßäüö')
+#separator to sanitize a whole column with one call
+SEPARATOR = '\x00'
+
+
+"""
+translation table for str.translate of ascii text, maps allowed characters to
+themselves and all other characters to ' ' (same as re.sub('[^a-zA-Z0-9@ßäüö]', ' ', ...))
+
+params
+------
+keep: String, additional characters mapped to themselves
+"""
+def asciiTable(keep = ''):
+    return { i : i if chr(i) in ALLOWED or chr(i) in keep else ord(' ') for i in range(128) }
+
+_columnTable = asciiTable(SEPARATOR)
+#for non ascii text a regexp is faster than str.translate
+_sanitizerExp = re.compile('[^a-zA-Z0-9@ßäüö]')
+_columnSanitizerExp = re.compile('[^a-zA-Z0-9@ßäüö' + SEPARATOR + ']')
+
+
+"""
+returns a function that reads a field from a record, relationship paths
+(Owner.Name) are read from the nested records (None if a relationship is empty)
+
+params
+------
+field: String, field name or relationship path
+"""
+def getter(field):
+    if "." not in field:
+        return lambda r: r[field]
+    path = field.split(".")
+
+    def get(r):
+        for name in path:
+            if r == None:
+                return None
+            r = r[name]
+        return r
+    return get
+
+
+"""
+projection of query records to lines of the requested fields
+the field list is compiled once, each page is transformed column by column
+
+    fields:   String, comma separated field names, if field name is "-" its an empty field,
+              relationship paths (Owner.Name) are read from the nested records
+    sanitize: bool, replace all non alphanumeric characters by ' '
+"""
+class Projection():
+    def __init__(self, fields, sanitize = True):
+        self.header = fields.split(",")
+        self.sanitize = sanitize
+        #field per column, None for empty columns
+        self.plan = [None if f == "-" else f for f in self.header]
+        #reader per column, None for simple fields
+        self.getters = [None if f == None or "." not in f else getter(f) for f in self.plan]
+        #fields to query (each field once)
+        self.fields = []
+        for f in self.header:
+            if f != "-" and f not in self.fields:
+                self.fields.append(f)
+
+    """
+    transforms the records of one page
+
+    params
+    ------
+    records: [], list of records (json dicts) as returned by a query
+
+    return
+    ------
+    list of lines, each line is a tuple of Strings
+    """
+    def apply(self, records):
+        if len(records) == 0:
+            return []
+        empty = [''] * len(records)
+        columns = []
+        for f, get in zip(self.plan, self.getters):
+            if f == None:
+                columns.append(empty)
+            elif get == None:
+                columns.append(self.column([str(r[f]) for r in records]))
+            else:
+                columns.append(self.column([str(get(r)) for r in records]))
+        return list(zip(*columns))
+
+    """
+    sanitizes the values of one column with one call, the joined column
+    is translated (ascii) or substituted with a regexp (non ascii)
+
+    params
+    ------
+    values: [], list of Strings
+
+    return
+    ------
+    list of Strings
+    """
+    def column(self, values):
+        if not self.sanitize:
+            return values
+        joined = SEPARATOR.join(values)
+        if joined.count(SEPARATOR) != len(values) - 1:
+            #a value contains the separator
+            return [_sanitizerExp.sub(' ', v) for v in values]
+        if joined.isascii():
+            joined = joined.translate(_columnTable)
+        else:
+            joined = _columnSanitizerExp.sub(' ', joined)
+        return joined.split(SEPARATOR)